@@ -10,9 +10,13 @@
     -----
 
         >>> import arista
-        >>> arista.init()
         >>> arista.presets.get()
-        {'name': Device(), ...}
+        <DeviceIndex ['android', 'apple', ...]>
+
+    Submodules are imported when they are first used, and GStreamer is
+    initialized by the parts that build pipelines or discover media, so
+    commands that only deal with presets start quickly. Call arista.init()
+    before using GStreamer directly.
 
     License
     -------
@@ -36,28 +40,56 @@
 """
 
 import gettext
-
-import gi
-gi.require_version('Gst', '1.0')
-from gi.repository import Gst
+import importlib
 
 _ = gettext.gettext
 
+# Submodules imported on first access, e.g. arista.presets
+_SUBMODULES = (
+    "autocrop",
+    "discoverer",
+    "dvd",
+    "inputs",
+    "interlace",
+    "mediafiles",
+    "output",
+    "presets",
+    "queue",
+    "readahead",
+    "sampler",
+    "streams",
+    "thumbnails",
+    "transcoder",
+    "utils",
+)
+
+_initialized = False
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module("." + name, __name__)
+
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
 def init():
     """
-        Initialize the arista module. You MUST call this method after
-        importing.
+        Initialize GStreamer, which scans the plugin registry. This is done
+        automatically before building pipelines or discovering media and
+        only needs to be called before using GStreamer directly. Calling it
+        more than once is harmless.
     """
-    from . import discoverer
-    from . import dvd
-    from . import inputs
-    from . import presets
-    from . import queue
-    from . import transcoder
-    from . import utils
+    global _initialized
+
+    if _initialized:
+        return
+
+    import gi
+    gi.require_version('Gst', '1.0')
+    from gi.repository import Gst
 
     # Ref: https://bugzilla.gnome.org/show_bug.cgi?id=655084#c1
     Gst.init()
+    _initialized = True
 
 __version__ = _("0.9.8")
 __author__ = _("Daniel G. Taylor <dan@programmer-art.org>")
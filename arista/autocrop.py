@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+"""
+    Arista Automatic Cropping
+    =========================
+    Detect black bars around letterboxed or pillarboxed video by sampling a
+    few frames spread over the input, so that they can be cropped before
+    encoding instead of wasting bits on them.
+
+    License
+    -------
+    Copyright 2008 - 2011 Daniel G. Taylor <dan@programmer-art.org>
+
+    This file is part of Arista.
+
+    Arista is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as
+    published by the Free Software Foundation, either version 2.1 of
+    the License, or (at your option) any later version.
+
+    Arista is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with Arista.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+import gettext
+import logging
+
+from .sampler import sample_frames
+
+_ = gettext.gettext
+_log = logging.getLogger("arista.autocrop")
+
+# Average luma at or below which a row or column is considered black. Video
+# black is 16 in limited range, so leave some room for noise.
+BLACK_THRESHOLD = 24
+
+
+def find_borders(data, width, height, stride, threshold=BLACK_THRESHOLD):
+    '''
+    Find the black borders in a GRAY8 frame. Returns None if the whole frame
+    is black (e.g. during a fade), which says nothing about the borders.
+
+    >>> row = bytes([16] * 2 + [128] * 4 + [16] * 2)
+    >>> black = bytes([16] * 8)
+    >>> frame = black * 2 + row * 4 + black * 2
+    >>> find_borders(frame, 8, 8, 8)
+    (2, 2, 2, 2)
+    >>> find_borders(black * 8, 8, 8, 8) is None
+    True
+    '''
+    def dark(values):
+        return sum(values) <= threshold * len(values)
+
+    def row(y):
+        return data[y * stride:y * stride + width]
+
+    top = 0
+    while top < height and dark(row(top)):
+        top += 1
+
+    if top == height:
+        return None
+
+    bottom = 0
+    while dark(row(height - bottom - 1)):
+        bottom += 1
+
+    def column(x):
+        return data[top * stride + x:(height - bottom) * stride:stride]
+
+    left = 0
+    while left < width and dark(column(left)):
+        left += 1
+
+    if left == width:
+        return None
+
+    right = 0
+    while dark(column(width - right - 1)):
+        right += 1
+
+    return (top, right, bottom, left)
+
+
+def merge_borders(samples):
+    '''
+    Merge borders found in several frames into a crop that is safe for all
+    of them, rounded down to even values.
+
+    >>> merge_borders([(60, 0, 62, 1), (58, 3, 60, 0), None])
+    (58, 0, 60, 0)
+    >>> merge_borders([None])
+    (0, 0, 0, 0)
+    '''
+    samples = [x for x in samples if x is not None]
+    if not samples:
+        return (0, 0, 0, 0)
+
+    return tuple(min(side) & ~1 for side in zip(*samples))
+
+
+def detect_crop(source, duration, samples=6):
+    '''
+    Detect black bars by looking at a number of frames spread over the
+    input.
+
+    @type source: str
+    @param source: A gst-launch source with a name=dmux decoder, as returned
+                   by Transcoder._get_source
+    @type duration: int
+    @param duration: The input duration in nanoseconds, 0 if unknown
+    @type samples: int
+    @param samples: The number of frames to look at
+    @rtype: tuple
+    @return: The crop as (top, right, bottom, left)
+    '''
+    found = [find_borders(*frame) for frame in
+             sample_frames(source, duration, samples)]
+
+    crop = merge_borders(found)
+
+    _log.debug(_("Detected crop %(crop)s from %(count)d frames") % {
+        "crop": crop,
+        "count": len(found),
+    })
+
+    return crop
@@ -40,6 +40,8 @@ gi.require_version('GstPbutils', '1.0')
 from gi.repository import Gst
 from gi.repository import GstPbutils
 
+from .utils import Fraction
+
 _ = gettext.gettext
 _log = logging.getLogger("arista.discoverer")
 
@@ -116,6 +118,19 @@ def get_list_value(gstruct, fieldname, coerce=int):
         return (coerce(m.group(1)),)
 
 
+
+def get_fraction_list_value(gstruct, fieldname):
+    '''
+    Get value of a fraction list field as tuple of Fraction in a Gst.Structure
+    '''
+    # The string can be
+    # video/mpeg, framerate=(fraction){ 24000/1001, 24/1, 25/1, 30000/1001 }
+    # If fieldname is 'framerate', we return (Fraction(24000, 1001), ...)
+    pattern = r'{}=\(fraction\){{ *(\d+/\d+ *(, *\d+/\d+)*) *}}'.format(fieldname)
+    m = re.search(pattern, gstruct.to_string())
+    if m:
+        return tuple(Fraction(i.strip()) for i in m.group(1).split(','))
+
 def get_video_dimension(info):
     '''
     Get tuple of width & height of video from GstPbutils.DiscovererInfo
@@ -125,3 +140,107 @@ def get_video_dimension(info):
     except IndexError:
         return
     return (v.get_width(), v.get_height())
+
+
+def get_string_list_value(gstruct, fieldname):
+    '''
+    Get value of a string or list of strings field as tuple in a Gst.Structure
+    '''
+    # The string can be
+    # video/x-raw, format=(string){ I420, YV12, Y42B, Y444, NV12 }
+    # or video/x-raw, format=(string)I420, width=(int)320
+    # If fieldname is 'format', we return ('I420', 'YV12', 'Y42B', ...)
+    pattern = r'{}=\(string\)(?:{{ *([^}}]*?) *}}|"?([^,;"]+)"?)'.format(fieldname)
+    m = re.search(pattern, gstruct.to_string())
+    if not m:
+        return
+    if m.group(1) is not None:
+        return tuple(i.strip().strip('"') for i in m.group(1).split(','))
+    return (m.group(2).strip(),)
+
+
+def get_caps_formats(caps):
+    '''
+    Get the set of raw formats accepted by any structure of Gst.Caps, or None
+    if the caps accept any format (e.g. the format field is not set)
+    '''
+    formats = set()
+    for i in range(caps.get_size()):
+        struct = caps.get_structure(i)
+        if not struct.has_field('format'):
+            return None
+        formats.update(get_string_list_value(struct, 'format') or ())
+    return formats
+
+
+def get_raw_format(stream):
+    '''
+    Get the raw format of a discovered stream, or None if the stream is
+    compressed and its decoded format is only known at negotiation time
+    '''
+    caps = stream.get_caps()
+    if not caps or not caps.get_size():
+        return
+    struct = caps.get_structure(0)
+    if struct.get_name() not in ('video/x-raw', 'audio/x-raw'):
+        return
+    value = get_string_list_value(struct, 'format')
+    if value and len(value) == 1:
+        return value[0]
+
+
+def get_factory_formats(name, direction=Gst.PadDirection.SRC):
+    '''
+    Get the set of raw formats the pad templates of an element factory
+    allow in one direction, or None if any format is allowed or the
+    element is not installed
+    '''
+    factory = name and Gst.ElementFactory.find(name)
+    if not factory:
+        return
+    formats = set()
+    for template in factory.get_static_pad_templates():
+        if template.direction == direction:
+            caps = get_caps_formats(template.get_caps())
+            if caps is None:
+                return
+            formats.update(caps)
+    return formats
+
+
+def get_decoded_format(stream):
+    '''
+    Get the raw format a compressed stream will be decoded to, or None if
+    the decoder that decodebin would pick can output more than one format
+    or interleaves audio channels differently than encoders expect
+    '''
+    caps = stream.get_caps()
+    if not caps or not caps.get_size():
+        return
+    factories = Gst.ElementFactory.list_get_elements(
+        Gst.ELEMENT_FACTORY_TYPE_DECODER, Gst.Rank.MARGINAL)
+    factories = Gst.ElementFactory.list_filter(
+        factories, caps, Gst.PadDirection.SINK, False)
+    if not factories:
+        return
+    # decodebin tries the decoders with the highest rank first
+    factory = max(factories, key=lambda x: x.get_rank())
+    for template in factory.get_static_pad_templates():
+        if template.direction != Gst.PadDirection.SRC:
+            continue
+        caps = template.get_caps()
+        for i in range(caps.get_size()):
+            layout = get_string_list_value(caps.get_structure(i), 'layout')
+            if layout and layout != ('interleaved',):
+                return
+    formats = get_factory_formats(factory.get_name())
+    if formats and len(formats) == 1:
+        return formats.pop()
+
+
+def get_stream_format(stream):
+    '''
+    Get the raw format the data of a discovered stream has once decoded,
+    or None if it is only known at negotiation time
+    '''
+    return get_raw_format(stream) or get_decoded_format(stream)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+"""
+    Arista Interlace Detection
+    ==========================
+    Find out whether an input is interlaced so that deinterlacing only runs
+    when it is needed. The discoverer and the discovered caps are used when
+    they say so, and a few frames are checked for combing otherwise.
+
+    License
+    -------
+    Copyright 2008 - 2011 Daniel G. Taylor <dan@programmer-art.org>
+
+    This file is part of Arista.
+
+    Arista is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as
+    published by the Free Software Foundation, either version 2.1 of
+    the License, or (at your option) any later version.
+
+    Arista is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with Arista.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+import gettext
+import logging
+
+from .sampler import sample_frames
+
+_ = gettext.gettext
+_log = logging.getLogger("arista.interlace")
+
+PROGRESSIVE = "progressive"
+INTERLACED = "interlaced"
+MIXED = "mixed"
+
+# Product of the differences of a pixel to the pixels above and below it
+# above which the pixel is considered combed
+COMB_THRESHOLD = 400
+
+# Ratio of combed pixels above which a frame is considered interlaced
+COMBED_FRAME_RATIO = 0.02
+
+# Share of combed frames needed to consider an input mixed. A single
+# combed frame is usually fast motion or a cut, not interlacing.
+MIXED_FRAME_SHARE = 0.25
+MIXED_MIN_FRAMES = 2
+
+
+def get_caps_interlacing(stream):
+    '''
+    Get the interlacing of a discovered video stream from its caps, or None
+    if the caps don't say.
+    '''
+    caps = stream.get_caps()
+    if not caps or not caps.get_size():
+        return
+    struct = caps.get_structure(0)
+    if not struct.has_field("interlace-mode"):
+        return
+    mode = struct.get_string("interlace-mode")
+    if mode == "progressive":
+        return PROGRESSIVE
+    elif mode == "mixed":
+        return MIXED
+    return INTERLACED
+
+
+def get_stream_interlacing(stream):
+    '''
+    Get the interlacing of a discovered video stream from the discoverer
+    and its caps, or None if neither says.
+    '''
+    if stream.is_interlaced():
+        return INTERLACED
+    return get_caps_interlacing(stream)
+
+
+def get_interlacing(combed, count):
+    '''
+    Get the interlacing of an input from how many of the sampled frames
+    are combed.
+
+    >>> get_interlacing(0, 8)
+    'progressive'
+    >>> get_interlacing(1, 4)
+    'progressive'
+    >>> get_interlacing(2, 8)
+    'mixed'
+    >>> get_interlacing(5, 8)
+    'interlaced'
+    >>> get_interlacing(1, 1)
+    'interlaced'
+    '''
+    if combed * 2 > count:
+        return INTERLACED
+    elif combed >= max(MIXED_MIN_FRAMES, count * MIXED_FRAME_SHARE):
+        return MIXED
+    return PROGRESSIVE
+
+
+def comb_ratio(data, width, height, stride, step=4):
+    '''
+    Get the ratio of combed pixels in a GRAY8 frame, looking at every step
+    columns and every other line.
+
+    >>> even = bytes([16] * 8)
+    >>> odd = bytes([235] * 8)
+    >>> comb_ratio((even + odd) * 4, 8, 8, 8)
+    1.0
+    >>> comb_ratio(even * 8, 8, 8, 8)
+    0.0
+    '''
+    combed = 0
+    total = 0
+    for y in range(1, height - 1, 2):
+        above = data[(y - 1) * stride:(y - 1) * stride + width:step]
+        line = data[y * stride:y * stride + width:step]
+        below = data[(y + 1) * stride:(y + 1) * stride + width:step]
+        for a, c, b in zip(above, line, below):
+            if (a - c) * (b - c) > COMB_THRESHOLD:
+                combed += 1
+        total += len(line)
+
+    return total and float(combed) / total or 0.0
+
+
+def detect_interlacing(source, stream, duration, samples=8):
+    '''
+    Detect whether a video stream is interlaced. The discoverer and the
+    caps are trusted when they say so, otherwise a few frames are sampled
+    and checked for combing.
+
+    @type source: str
+    @param source: A gst-launch source with a name=dmux decoder, as returned
+                   by Transcoder._get_source
+    @type stream: GstPbutils.DiscovererVideoInfo
+    @param stream: The discovered video stream
+    @type duration: int
+    @param duration: The input duration in nanoseconds, 0 if unknown
+    @type samples: int
+    @param samples: The number of frames to look at if the caps don't say
+    @rtype: str
+    @return: One of PROGRESSIVE, INTERLACED or MIXED
+    '''
+    mode = get_stream_interlacing(stream)
+    if mode:
+        _log.debug(_("Discovery says the input is %(mode)s") % {
+            "mode": mode,
+        })
+        return mode
+
+    ratios = [comb_ratio(*frame) for frame in
+              sample_frames(source, duration, samples)]
+    combed = len([x for x in ratios if x > COMBED_FRAME_RATIO])
+    mode = get_interlacing(combed, len(ratios))
+
+    _log.debug(_("%(combed)d of %(count)d frames are combed, input is "
+                 "%(mode)s") % {
+        "combed": combed,
+        "count": len(ratios),
+        "mode": mode,
+    })
+
+    return mode
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+"""
+    Arista Media File Scanning
+    ==========================
+    Find media files in directory trees. Directories are walked lazily with
+    os.scandir, so files are yielded as they are found and a tree of any
+    size costs no more memory than its deepest path. Files are picked by
+    their extension, and files without a known extension are recognized by
+    the first bytes of their content.
+
+    Example Use
+    -----------
+
+        >>> import arista.mediafiles
+        >>> for filename in arista.mediafiles.iter_inputs(["/home/me/videos"]):
+        ...     print(filename)
+        /home/me/videos/holiday.mkv
+        /home/me/videos/2010/birthday.avi
+
+    License
+    -------
+    Copyright 2008 - 2011 Daniel G. Taylor <dan@programmer-art.org>
+
+    This file is part of Arista.
+
+    Arista is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as
+    published by the Free Software Foundation, either version 2.1 of
+    the License, or (at your option) any later version.
+
+    Arista is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with Arista.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import gettext
+import logging
+import mimetypes
+
+_ = gettext.gettext
+_log = logging.getLogger("arista.mediafiles")
+
+# Media extensions the mimetypes module may not know about
+MEDIA_EXTENSIONS = frozenset([
+    ".3gp", ".aac", ".ac3", ".aif", ".aiff", ".amr", ".ape", ".asf", ".avi",
+    ".divx", ".dv", ".f4v", ".flac", ".flv", ".m1v", ".m2t", ".m2ts",
+    ".m2v", ".m4a", ".m4v", ".mka", ".mkv", ".mov", ".mp2", ".mp3", ".mp4",
+    ".mpeg", ".mpg", ".mts", ".mxf", ".nut", ".oga", ".ogg", ".ogm",
+    ".ogv", ".opus", ".ra", ".rm", ".rmvb", ".spx", ".ts", ".vob", ".wav",
+    ".webm", ".wma", ".wmv", ".wv", ".y4m",
+])
+
+# Signatures at the start of media files as (offset, bytes)
+MEDIA_SIGNATURES = (
+    (0, b"RIFF"),              # AVI, WAV
+    (0, b"\x1a\x45\xdf\xa3"),  # Matroska, WebM
+    (4, b"ftyp"),              # MP4, QuickTime
+    (4, b"moov"),
+    (4, b"mdat"),
+    (0, b"OggS"),
+    (0, b"fLaC"),
+    (0, b"ID3"),               # MP3 with tags
+    (0, b"FLV"),
+    (0, b"\x00\x00\x01\xba"),  # MPEG program stream
+    (0, b"\x00\x00\x01\xb3"),  # MPEG video
+    (0, b"\x30\x26\xb2\x75"),  # ASF, WMV
+    (0, b".RMF"),
+    (0, b"FORM"),              # AIFF
+    (0, b"YUV4MPEG2"),
+    (0, b"wvpk"),
+)
+
+# MPEG transport streams have a sync byte every 188 (or 192) bytes
+TS_PACKET_SIZES = (188, 192)
+
+# How many bytes to read when sniffing
+SNIFF_SIZE = 2 * 192 + 5
+
+
+def is_media_data(data):
+    '''
+    Check whether the first bytes of a file look like a media file.
+
+    >>> is_media_data(b"\\x00\\x00\\x00\\x20ftypisom")
+    True
+    >>> is_media_data(b"G" + bytes(187) + b"G" + bytes(187) + b"G")
+    True
+    >>> is_media_data(b"Hello world!")
+    False
+    '''
+    for offset, signature in MEDIA_SIGNATURES:
+        if data[offset:offset + len(signature)] == signature:
+            return True
+
+    for size in TS_PACKET_SIZES:
+        offset = size - 188
+        if len(data) > 2 * size + offset and \
+           data[offset:2 * size + offset + 1:size] == b"GGG":
+            return True
+
+    return False
+
+
+def sniff(path):
+    """
+        Check whether a file looks like a media file from its content.
+
+        @type path: str
+        @param path: The file to check
+        @rtype: bool
+        @return: True if the file starts like a known media format
+    """
+    try:
+        with open(path, "rb") as f:
+            return is_media_data(f.read(SNIFF_SIZE))
+    except OSError:
+        return False
+
+
+def is_media(path, sniff_unknown=True):
+    '''
+    Check whether a file is a media file. Known extensions decide without
+    opening the file; files with other extensions can be sniffed.
+
+    >>> is_media("/videos/clip.MKV")
+    True
+    >>> is_media("/videos/notes.txt")
+    False
+
+    @type path: str
+    @param path: The file to check
+    @type sniff_unknown: bool
+    @param sniff_unknown: Look at the content of files with an unknown or
+                          missing extension
+    @rtype: bool
+    @return: True if the file is a media file
+    '''
+    ext = os.path.splitext(path)[1].lower()
+    if ext in MEDIA_EXTENSIONS:
+        return True
+
+    mimetype = mimetypes.guess_type("x" + ext, strict=False)[0]
+    if mimetype:
+        return mimetype.startswith(("video/", "audio/"))
+
+    return sniff_unknown and sniff(path)
+
+
+def walk(directory):
+    """
+        Lazily yield the paths of all files below a directory, in name
+        order. Hidden files and directories are skipped, as are symlinks to
+        directories, which could form loops.
+
+        @type directory: str
+        @param directory: The directory to walk
+        @rtype: generator
+        @return: File paths
+    """
+    pending = [directory]
+    while pending:
+        current = pending.pop()
+        try:
+            with os.scandir(current) as it:
+                entries = sorted([entry for entry in it
+                                  if not entry.name.startswith(".")],
+                                 key=lambda entry: entry.name)
+        except OSError as e:
+            _log.warning(_("Unable to read directory %(directory)s: " \
+                           "%(error)s") % {
+                "directory": current,
+                "error": str(e),
+            })
+            continue
+
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file():
+                    yield entry.path
+            except OSError:
+                continue
+
+        # Depth first, in name order
+        pending.extend(reversed(subdirs))
+
+
+def iter_inputs(paths, skip=None, sniff_unknown=True):
+    """
+        Lazily expand a list of inputs. Directories are replaced by the
+        media files found in them; files, URIs and other inputs are passed
+        through unchanged.
+
+        @type paths: list
+        @param paths: Input files, directories and URIs
+        @type skip: callable
+        @param skip: Called with each file found in a directory; files for
+                     which it returns True are left out, e.g. outputs
+                     written into the tree that is being walked
+        @type sniff_unknown: bool
+        @param sniff_unknown: Look at the content of files with an unknown
+                              or missing extension
+        @rtype: generator
+        @return: Input paths and URIs
+    """
+    for path in paths:
+        if "://" in path or not os.path.isdir(path):
+            yield path
+            continue
+
+        for filename in walk(path):
+            if skip and skip(filename):
+                continue
+            if is_media(filename, sniff_unknown):
+                yield filename
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+
+"""
+    Arista Output Files
+    ===================
+    Write output to a temporary file next to the final name and only move it
+    into place once the encode is complete, so a crashed or cancelled job
+    never leaves a truncated file that looks finished.
+
+    License
+    -------
+    Copyright 2008 - 2011 Daniel G. Taylor <dan@programmer-art.org>
+
+    This file is part of Arista.
+
+    Arista is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as
+    published by the Free Software Foundation, either version 2.1 of
+    the License, or (at your option) any later version.
+
+    Arista is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with Arista.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import struct
+import gettext
+import logging
+import secrets
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+_ = gettext.gettext
+_log = logging.getLogger("arista.output")
+
+# filesink buffer modes
+BUFFER_MODES = ("default", "full", "line", "unbuffered")
+
+# Encoder bitrate properties and their unit in bits per second, used to
+# estimate the output size
+BITRATE_PROPERTIES = {
+    "x264enc": ("bitrate", 1000),
+    "x265enc": ("bitrate", 1000),
+    "theoraenc": ("bitrate", 1000),
+    "mpeg2enc": ("bitrate", 1000),
+    "vp8enc": ("target-bitrate", 1),
+    "vp9enc": ("target-bitrate", 1),
+    "xvidenc": ("bitrate", 1),
+    "avenc_mpeg4": ("bitrate", 1),
+    "avenc_mpeg2video": ("bitrate", 1),
+    "avenc_h263p": ("bitrate", 1),
+    "faac": ("bitrate", 1),
+    "voaacenc": ("bitrate", 1),
+    "avenc_aac": ("bitrate", 1),
+    "avenc_ac3": ("bitrate", 1),
+    "avenc_mp2": ("bitrate", 1),
+    "vorbisenc": ("bitrate", 1),
+    "opusenc": ("bitrate", 1),
+    "lamemp3enc": ("bitrate", 1000),
+    "twolame": ("bitrate", 1000),
+}
+
+# Muxing overhead added to the estimated size
+CONTAINER_OVERHEAD = 1.02
+
+
+def get_bitrate(element, properties):
+    '''
+    Get the bitrate an encoder pass is set to in bits per second, or None if
+    it is unknown, e.g. because the pass encodes with a constant quality.
+
+    >>> get_bitrate("x264enc", {"pass": 17, "bitrate": 2048})
+    2048000
+    >>> get_bitrate("vorbisenc", {"quality": 0.5}) is None
+    True
+    '''
+    prop, scale = BITRATE_PROPERTIES.get(element, (None, 0))
+    if prop not in properties:
+        return None
+
+    try:
+        return int(properties[prop]) * scale
+    except ValueError:
+        return None
+
+
+def estimate_size(bitrate, duration):
+    '''
+    Estimate the output size in bytes from the total bitrate in bits per
+    second and the duration in nanoseconds.
+
+    >>> estimate_size(1000000, 60 * Gst.SECOND)
+    7650000
+    >>> estimate_size(0, 60 * Gst.SECOND)
+    0
+    '''
+    return int(bitrate * duration / Gst.SECOND / 8 * CONTAINER_OVERHEAD)
+
+
+def get_top_level_atoms(f):
+    '''
+    Get the types of the top level atoms of an MP4/QuickTime file.
+
+    >>> import io
+    >>> atom = lambda kind, size: struct.pack(">I4s", size, kind) + \\
+    ...                           bytes(size - 8)
+    >>> data = atom(b"ftyp", 16) + atom(b"moov", 8) + atom(b"mdat", 24)
+    >>> get_top_level_atoms(io.BytesIO(data))
+    ['ftyp', 'moov', 'mdat']
+    '''
+    atoms = []
+    offset = 0
+    while True:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            break
+
+        size, kind = struct.unpack(">I4s", header)
+        atoms.append(kind.decode("latin-1"))
+        if size == 1:
+            extended = f.read(8)
+            if len(extended) < 8:
+                break
+            size = struct.unpack(">Q", extended)[0]
+        elif size == 0:
+            # The last atom extends to the end of the file
+            break
+
+        if size < 8:
+            break
+        offset += size
+
+    return atoms
+
+
+def is_faststart(filename):
+    '''
+    Check whether the index (moov atom) of an MP4/QuickTime file comes
+    before the media data, so playback can start while downloading.
+
+    @type filename: str
+    @param filename: The file to check
+    @rtype: bool
+    @return: True if the moov atom comes before the first mdat atom
+    '''
+    with open(filename, "rb") as f:
+        atoms = get_top_level_atoms(f)
+
+    if "moov" not in atoms:
+        return False
+
+    return "mdat" not in atoms or atoms.index("moov") < atoms.index("mdat")
+
+
+def sync_directory(directory):
+    """
+        Flush a directory to disk, so that a file renamed into it is still
+        there after a crash.
+
+        @type directory: str
+        @param directory: The directory to flush
+    """
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        os.fsync(fd)
+    except OSError:
+        # Not supported by every file system
+        pass
+    finally:
+        os.close(fd)
+
+
+class AtomicOutput(object):
+    """
+        A temporary output file in the same directory as the final output,
+        which is renamed to the final name on commit() and deleted on
+        discard().
+    """
+    def __init__(self, filename):
+        """
+            @type filename: str
+            @param filename: The final output filename
+        """
+        self.filename = filename
+
+        directory, name = os.path.split(os.path.abspath(filename))
+
+        # Unlike tempfile.mkstemp, which creates owner-only files, create
+        # the file with the permissions of the finished output
+        while True:
+            self.path = os.path.join(directory, ".%s.%s.part" %
+                                     (name, secrets.token_hex(4)))
+            try:
+                os.close(os.open(self.path, os.O_WRONLY | os.O_CREAT |
+                                            os.O_EXCL, 0o666))
+            except FileExistsError:
+                continue
+            break
+
+        self.done = False
+        self._position = 0
+        self._end = 0
+
+    def __repr__(self):
+        return "<AtomicOutput %s>" % self.filename
+
+    def preallocate(self, size):
+        """
+            Reserve space for the output so it is written in as few extents
+            as possible. The file must already be opened by the sink, as
+            opening it for writing truncates it again.
+
+            @type size: int
+            @param size: The estimated output size in bytes
+        """
+        if not size or not hasattr(os, "posix_fallocate"):
+            return
+
+        try:
+            fd = os.open(self.path, os.O_WRONLY)
+            try:
+                os.posix_fallocate(fd, 0, size)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            _log.debug(_("Unable to preallocate %(path)s: %(error)s") % {
+                "path": self.path,
+                "error": str(e),
+            })
+
+    def track(self, sink):
+        """
+            Keep track of how much data a sink really writes, so that the
+            preallocated space after it can be cut off again.
+
+            @type sink: Gst.Element
+            @param sink: The file sink writing to self.path
+        """
+        self._position = 0
+        self._end = 0
+        sink.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER |
+                                              Gst.PadProbeType.EVENT_DOWNSTREAM,
+                                              self._on_probe)
+
+    def _on_probe(self, pad, info):
+        if info.type & Gst.PadProbeType.BUFFER:
+            self._position += info.get_buffer().get_size()
+            self._end = max(self._end, self._position)
+        else:
+            event = info.get_event()
+            if event.type == Gst.EventType.SEGMENT:
+                # Muxers seek back to rewrite headers with byte segments
+                segment = event.parse_segment()
+                if segment.format == Gst.Format.BYTES:
+                    self._position = segment.start
+        return Gst.PadProbeReturn.OK
+
+    def commit(self):
+        """
+            Cut off unused preallocated space, flush the data to disk and
+            atomically move the file to its final name.
+        """
+        if self.done:
+            return
+
+        fd = os.open(self.path, os.O_WRONLY)
+        try:
+            if self._end and os.fstat(fd).st_size > self._end:
+                os.ftruncate(fd, self._end)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        os.replace(self.path, self.filename)
+        self.done = True
+        sync_directory(os.path.dirname(os.path.abspath(self.filename)))
+
+        _log.debug(_("Moved %(path)s to %(filename)s") % {
+            "path": self.path,
+            "filename": self.filename,
+        })
+
+    def discard(self):
+        """
+            Delete the temporary file, e.g. after an error or cancellation.
+        """
+        if self.done:
+            return
+
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        self.done = True
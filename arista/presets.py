@@ -7,11 +7,15 @@
 
     Example Use
     -----------
-    Presets are automatically loaded when the module is initialized.
+    Presets are loaded the first time they are needed. Only a small index of
+    the devices is read at first, which is cached on disk; the device files
+    themselves are loaded when a device is accessed.
 
         >>> import arista.presets
         >>> arista.presets.get()
-        { "name": Device, ... }
+        <DeviceIndex ['android', 'apple', ...]>
+        >>> arista.presets.get()["computer"]
+        <Device: Generic Computer>
 
     If you have other paths to load, use:
 
@@ -43,29 +47,138 @@ import os
 import sys
 import json
 import gettext
+import shlex
 import shutil
 import logging
-import subprocess
 import tarfile
+import bisect
 import platform
-import urllib.request
-from collections import OrderedDict
+import functools
+import threading
+import http.client
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, namedtuple
+from collections.abc import MutableMapping
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 import gi
 
 gi.require_version('Gst', '1.0')
 gi.require_version('GstPbutils', '1.0')
+from gi.repository import Gio
 from gi.repository import GLib
+from gi.repository import GObject
 from gi.repository import Gst
 from gi.repository import GstPbutils
 
+from . import init as gst_init
 from . import utils
-from .utils import Fraction
+from .utils import Fraction, CPU_COUNT
 
 _ = gettext.gettext
-_presets = {}
+_presets = None
+_registry = None
+_property_specs = {}
+_availability = None
 _log = logging.getLogger("arista.presets")
 
+# Bump when the format of the cached preset index changes
+INDEX_VERSION = 2
+
+# Format names that can be used instead of encoder names in queries
+CODEC_ALIASES = {
+    "h264": ("x264enc", "avenc_h264_omx", "vaapih264enc"),
+    "h265": ("x265enc",),
+    "hevc": ("x265enc",),
+    "vp8": ("vp8enc",),
+    "vp9": ("vp9enc",),
+    "theora": ("theoraenc",),
+    "mpeg4": ("xvidenc", "avenc_mpeg4"),
+    "divx": ("xvidenc", "avenc_mpeg4"),
+    "mpeg2": ("mpeg2enc", "avenc_mpeg2video"),
+    "aac": ("faac", "avenc_aac", "voaacenc"),
+    "mp3": ("lamemp3enc",),
+    "mp2": ("twolame", "avenc_mp2"),
+    "ac3": ("avenc_ac3",),
+    "vorbis": ("vorbisenc",),
+    "opus": ("opusenc",),
+    "flac": ("flacenc",),
+}
+
+# Ways to put the MP4/QuickTime index at the start of the file, see
+# Preset.faststart
+FASTSTART_RESERVE = "reserve"
+FASTSTART_FRAGMENT = "fragment"
+
+# Compressions for exported presets and their filename extensions. zstd
+# needs the zstandard module.
+ARCHIVE_COMPRESSIONS = OrderedDict([
+    ("gz", (".tar.gz", ".tgz")),
+    ("xz", (".tar.xz", ".txz")),
+    ("bz2", (".tar.bz2", ".tbz2")),
+    ("zst", (".tar.zst", ".tzst")),
+])
+
+# Compression used when the filename doesn't select one
+DEFAULT_COMPRESSION = "gz"
+
+# The first bytes of zstd compressed data
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# How many preset archives are downloaded at once
+FETCH_WORKERS = 4
+
+# Seconds to wait for the preset site
+FETCH_TIMEOUT = 30
+
+# How many redirects are followed when fetching a preset archive
+FETCH_MAX_REDIRECTS = 5
+
+# Milliseconds to wait for more changes before reloading preset files
+RELOAD_DELAY = 500
+
+# Elements the transcoder uses besides the ones named in presets
+INTERNAL_ELEMENTS = (
+    "decodebin",
+    "videobox",
+    "videoconvert",
+    "videoscale",
+    "videorate",
+    "audioconvert",
+    "audiorate",
+    "audioresample",
+    "tee",
+    "queue",
+)
+
+# Element used to deinterlace, only needed by jobs that deinterlace
+DEINTERLACER = "avdeinterlace"
+
+# Variables that can be used in pass strings, e.g. threads=%(threads)s
+PASS_VARIABLES = {
+    "threads": CPU_COUNT,
+}
+
+# Property types that are converted and range checked when compiling
+# passes. Values of other types, e.g. flags or caps, are kept as strings
+# and parsed by GStreamer when they are set.
+INTEGER_TYPES = (GObject.TYPE_INT, GObject.TYPE_UINT, GObject.TYPE_LONG,
+                 GObject.TYPE_ULONG, GObject.TYPE_INT64, GObject.TYPE_UINT64,
+                 GObject.TYPE_CHAR, GObject.TYPE_UCHAR)
+FLOAT_TYPES = (GObject.TYPE_FLOAT, GObject.TYPE_DOUBLE)
+
+
+class PresetError(Exception):
+    """
+        An exception to be thrown when a preset contains invalid settings.
+    """
+    pass
+
 
 class Author:
     """
@@ -214,6 +327,7 @@ class Device:
                 },
                 "container": preset.container,
                 "extension": preset.extension,
+                "faststart": preset.faststart,
                 "icon": preset.icon,
                 "version": preset.version,
                 "acodec": {
@@ -245,11 +359,18 @@ class Device:
         """
         open(self.filename, "w").write(self.json)
 
-    def export(self, filename):
+    def export(self, filename, compression=None):
         """
-            Export this device and all presets to a file. Creates a bzipped
-            tarball of the JSON and all associated images that can be easily
-            imported later.
+            Export this device and all presets to a file. Creates a
+            compressed tarball of the JSON and all associated images that can
+            be easily imported later.
+
+            @type filename: str
+            @param filename: The file to write
+            @type compression: str
+            @param compression: One of ARCHIVE_COMPRESSIONS; by default it is
+                                picked from the filename extension, falling
+                                back to DEFAULT_COMPRESSION
         """
         # Make sure all changes are saved
         self.save()
@@ -260,12 +381,19 @@ class Device:
             if preset.icon:
                 images.add(preset.icon[7:])
 
-        files = " ".join([os.path.basename(self.filename)] + list(images))
+        if compression is None:
+            compression = get_compression(filename) or DEFAULT_COMPRESSION
 
-        cwd = os.getcwd()
-        os.chdir(os.path.dirname(self.filename))
-        subprocess.call("tar -cjf %s %s" % (filename, files), shell=True)
-        os.chdir(cwd)
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        try:
+            with open(filename, "wb") as f:
+                write_archive(f, directory, [os.path.basename(self.filename)] +
+                                            sorted(images), compression)
+        except (OSError, ValueError, tarfile.TarError):
+            # Don't leave a broken archive behind
+            if os.path.exists(filename):
+                os.unlink(filename)
+            raise
 
     @staticmethod
     def from_json(data):
@@ -299,6 +427,7 @@ class Device:
                 ),
                 "container": preset.get("container", ""),
                 "extension": preset.get("extension", ""),
+                "faststart": preset.get("faststart", None),
                 "version": preset.get("version", device.version),
                 "icon": preset.get("icon", device.icon),
                 "acodec": AudioCodec(**{
@@ -322,6 +451,19 @@ class Device:
                 "device": device,
             })
 
+        for name, preset in list(device.presets.items()):
+            try:
+                preset.acodec.compile(validate=False)
+                preset.vcodec.compile(validate=False)
+            except PresetError as e:
+                _log.error(_("Skipping preset %(device)s - %(preset)s: "
+                             "%(error)s") % {
+                    "device": device.name,
+                    "preset": name,
+                    "error": str(e),
+                })
+                del device.presets[name]
+
         return device
 
 
@@ -332,7 +474,8 @@ class Preset:
     """
     def __init__(self, name = "", container = "", extension = "",
                  acodec = None, vcodec = None, device = None, icon = None,
-                 version = None, description = None, author = None):
+                 version = None, description = None, author = None,
+                 faststart = None):
         """
             @type name: str
             @param name: The name of the preset, e.g. "High Quality"
@@ -346,6 +489,13 @@ class Preset:
             @param vcodec: The video encoding settings
             @type device: Device
             @param device: A link back to the device this preset belongs to
+            @type faststart: str
+            @param faststart: How MP4/QuickTime output gets its index at the
+                              start so playback can begin before the whole
+                              file is downloaded: FASTSTART_RESERVE reserves
+                              space for it sized from the input duration,
+                              FASTSTART_FRAGMENT writes fragmented MP4.
+                              None leaves the muxer as configured.
         """
         self.name = name
         self.description = description
@@ -357,6 +507,7 @@ class Preset:
         self.device = device
         self.version = version
         self.icon = icon
+        self.faststart = faststart
 
     def __repr__(self):
         return '<Preset {} {}>'.format(self.name, self.container)
@@ -379,9 +530,68 @@ class Preset:
             @return: A slug based on the preset name safe to use as a filename
                      or in links
         """
-        slug = ".".join(os.path.basename(self.device.filename).split(".")[:-1]) + "-" + self.name.lower()
+        return make_slug(self.device.short_name, self.name)
+
+    @property
+    def missing(self):
+        """
+            @rtype: list
+            @return: The elements used by this preset that are not installed
+        """
+        return self.get_missing()
+
+    def get_missing(self, deinterlace=False):
+        """
+            Get the elements a job with this preset needs that are not
+            installed.
+
+            @type deinterlace: bool
+            @param deinterlace: Whether the job always deinterlaces
+            @rtype: list
+            @return: The names of the missing elements
+        """
+        elements = [self.container.split(" ")[0], self.acodec.name,
+                    self.vcodec.name]
+        if deinterlace:
+            elements.append(DEINTERLACER)
+
+        return get_missing_elements(elements)
+
+    @property
+    def error(self):
+        """
+            Check the passes of this preset against the properties of the
+            encoders. This is done once, when the preset is first used.
+
+            @rtype: str
+            @return: Why the preset is invalid, or None if it is valid
+        """
+        try:
+            self.compile()
+        except PresetError as e:
+            return str(e)
+
+        return None
+
+    @property
+    def available(self):
+        """
+            @rtype: bool
+            @return: Whether all elements used by this preset are installed
+                     and its passes are valid
+        """
+        return not self.missing and not self.error
 
-        return slug.replace(" ", "_").replace("'", "").replace("/", "")
+    def compile(self):
+        """
+            Compile the audio and video passes of this preset and check them
+            against the properties of the encoders.
+
+            @raise PresetError: A pass sets a property the encoder does not
+                                have or to a value it does not accept
+        """
+        self.acodec.compile()
+        self.vcodec.compile()
 
     def check_elements(self, callback, *args):
         """
@@ -394,37 +604,12 @@ class Preset:
             @rtype: bool
             @return: True if required elements are available, False otherwise
         """
-        elements = [
-            # Elements defined in external files
-            self.container,
-            self.acodec.name,
-            self.vcodec.name,
-            # Elements used internally
-            "decodebin",
-            "videobox",
-            "videoconvert",
-            "videoscale",
-            "videorate",
-            "avdeinterlace",
-            "audioconvert",
-            "audiorate",
-            "audioresample",
-            "tee",
-            "queue",
-        ]
-
-        missing = []
-        missingdesc = ""
-        for element in elements:
-            if not Gst.ElementFactory.find(element):
-                missing.append(GstPbutils.missing_element_installer_detail_new(element))
-                if missingdesc:
-                    missingdesc += ", %s" % element
-                else:
-                    missingdesc += element
+        elements = self.missing
+        missing = [GstPbutils.missing_element_installer_detail_new(element)
+                   for element in elements]
 
         if missing:
-            _log.info("Attempting to install elements: %s" % missingdesc)
+            _log.info("Attempting to install elements: %s" % ", ".join(elements))
             if GstPbutils.install_plugins_supported():
                 def install_done(result, null):
                     if result == GstPbutils.InstallPluginsReturn.INSTALL_IN_PROGRESS:
@@ -467,12 +652,58 @@ class Codec:
 
         self.rate = (Fraction(), Fraction())
 
+        self._compiled = None
+        self._compiled_passes = None
+        self._validated = False
+        self._error = None
+
     def __repr__(self):
         return '<Codec {} {}>'.format(self.name, self.container)
 
     def __str__(self):
         return '{} {}'.format(self.name, self.container)
 
+    def compile(self, validate=True):
+        """
+            Compile the pass strings into EncoderPass objects. The result is
+            kept until the pass strings or the encoder name change.
+
+            @type validate: bool
+            @param validate: Also convert the values to the types of the
+                             encoder properties and check them, which needs
+                             GStreamer and the encoder element. Passes of
+                             missing encoders are left unchecked.
+            @rtype: list
+            @return: An EncoderPass for each pass
+            @raise PresetError: A pass is invalid
+        """
+        source = (self.name, list(self.passes))
+        if self._compiled_passes != source:
+            self._compiled = None
+            self._compiled_passes = source
+            self._validated = False
+            self._error = None
+
+        # Invalid passes are only checked once until they change
+        if self._error:
+            raise PresetError(self._error)
+
+        try:
+            if self._compiled is None:
+                self._compiled = [compile_pass(pas) for pas in self.passes]
+
+            if validate and not self._validated and self.name:
+                specs = get_property_specs(self.name)
+                if specs is not None:
+                    for pas in self._compiled:
+                        pas.validate(self.name, specs)
+                    self._validated = True
+        except PresetError as e:
+            self._error = str(e)
+            raise
+
+        return self._compiled
+
 
 class AudioCodec(Codec):
     """
@@ -501,6 +732,368 @@ class VideoCodec(Codec):
         self.transform = transform
 
 
+class EncoderPass:
+    """
+        The encoder settings of one pass, compiled from a pass string such
+        as "pass=cbr bitrate=2048 ! video/x-h264,profile=baseline". The
+        properties can be set on the encoder element directly and the caps
+        go into a capsfilter after it.
+    """
+    def __init__(self, properties=None, caps=""):
+        """
+            @type properties: OrderedDict
+            @param properties: The encoder properties by name
+            @type caps: str
+            @param caps: Caps to force after the encoder, if any
+        """
+        self.properties = properties and properties or OrderedDict()
+        self.caps = caps
+
+    def __repr__(self):
+        return '<EncoderPass {}>'.format(self)
+
+    def __str__(self):
+        pas = make_pass_from_dict(self.properties)
+        if self.caps:
+            pas += " ! " + self.caps
+        return pas
+
+    def validate(self, element, specs):
+        """
+            Convert the property values to the types of the encoder
+            properties, checking names, ranges and enum values.
+
+            @type element: str
+            @param element: The encoder element name, e.g. x264enc
+            @type specs: dict
+            @param specs: The encoder property specs by name, see
+                          get_property_specs
+            @raise PresetError: A property is unknown or its value invalid
+        """
+        properties = OrderedDict()
+        for key, value in self.properties.items():
+            spec = specs.get(key)
+            if spec is None or not spec.flags & GObject.ParamFlags.WRITABLE:
+                raise PresetError(_("%(element)s has no property "
+                                    "%(property)s") % {
+                    "element": element,
+                    "property": key,
+                })
+
+            try:
+                properties[key] = convert_property(spec, value)
+            except ValueError as e:
+                raise PresetError(_("Invalid value %(value)s for "
+                                    "%(element)s property %(property)s: "
+                                    "%(error)s") % {
+                    "value": value,
+                    "element": element,
+                    "property": key,
+                    "error": str(e),
+                })
+
+        self.properties = properties
+
+    def apply(self, element, properties=None):
+        """
+            Set the properties on an encoder element.
+
+            @type element: Gst.Element
+            @param element: The encoder
+            @type properties: dict
+            @param properties: Properties to set instead of self.properties,
+                               e.g. a modified copy of them
+        """
+        if properties is None:
+            properties = self.properties
+
+        for key, value in properties.items():
+            if isinstance(value, str):
+                Gst.util_set_object_arg(element, key, value)
+            else:
+                element.set_property(key, value)
+
+
+class DeviceIndex(MutableMapping):
+    """
+        A dictionary of devices where the keys are the device short names.
+        Devices found in preset files are only loaded from their file when
+        they are first accessed; until then a summary from the preset index
+        is available through summary().
+    """
+    def __init__(self):
+        self._files = {}
+        self._summaries = {}
+        self._devices = {}
+        self._stamps = {}
+
+        # Changed whenever devices are added or removed
+        self.generation = 0
+
+    def __repr__(self):
+        return "<DeviceIndex %s>" % sorted(self._files)
+
+    def __getitem__(self, name):
+        if name not in self._devices:
+            filename = self._files[name]
+            try:
+                self._devices[name] = load(filename)
+            except (OSError, ValueError) as e:
+                _log.warning(_("Problem loading %(filename)s! %(error)s") % {
+                    "filename": filename,
+                    "error": str(e),
+                })
+                raise KeyError(name)
+
+        return self._devices[name]
+
+    def __setitem__(self, name, device):
+        self._files[name] = device.filename
+        self._summaries[name] = summarize(json.loads(device.json))
+        self._devices[name] = device
+        self._stamps.pop(name, None)
+        self.generation += 1
+
+    def __delitem__(self, name):
+        del self._files[name]
+        del self._summaries[name]
+        self._devices.pop(name, None)
+        self._stamps.pop(name, None)
+        self.generation += 1
+
+    def __iter__(self):
+        return iter(self._files)
+
+    def __len__(self):
+        return len(self._files)
+
+    def add_file(self, name, filename, summary, stamp=None):
+        """
+            Add a device preset file without loading it.
+
+            @type name: str
+            @param name: The device short name
+            @type filename: str
+            @param filename: The device preset file
+            @type summary: dict
+            @param summary: The summary of the file as returned by summarize()
+            @type stamp: tuple
+            @param stamp: The modification time and size of the file, used
+                          to find out whether it changed
+        """
+        self._files[name] = filename
+        self._summaries[name] = summary
+        self._devices.pop(name, None)
+        self._stamps[name] = stamp
+        self.generation += 1
+
+    def update(self, directory, index):
+        """
+            Bring the devices from a directory up to date with its index: add
+            new files, replace the devices whose file changed and remove the
+            ones whose file is gone. Replaced devices are loaded into new
+            objects, so presets in use elsewhere, e.g. by queued jobs, keep
+            their settings.
+
+            @type directory: str
+            @param directory: The absolute path of the directory
+            @type index: dict
+            @param index: The directory index as returned by index_directory
+            @rtype: tuple
+            @return: Lists of the added, changed and removed device names
+        """
+        added, changed, removed = [], [], []
+
+        for name, filename in list(self._files.items()):
+            if filename and name not in index and \
+               os.path.dirname(os.path.abspath(filename)) == directory:
+                del self[name]
+                removed.append(name)
+
+        for name, (filename, summary, stamp) in index.items():
+            if name not in self._files:
+                added.append(name)
+            elif self._files[name] != filename or \
+                 self._stamps.get(name) != stamp:
+                changed.append(name)
+            else:
+                continue
+            self.add_file(name, filename, summary, stamp)
+
+        return (added, changed, removed)
+
+    def summary(self, name):
+        """
+            Get the indexed summary of a device without loading it.
+
+            @type name: str
+            @param name: The device short name
+            @rtype: dict
+            @return: The summary as returned by summarize()
+        """
+        return self._summaries[name]
+
+    def is_loaded(self, name):
+        """
+            @rtype: bool
+            @return: Whether the device has been loaded from its file
+        """
+        return name in self._devices
+
+
+def summarize(parsed):
+    """
+        Get the part of a parsed device preset file that is kept in the
+        preset index: device names and versions, and preset names with their
+        container and codecs.
+
+        @type parsed: dict
+        @param parsed: The parsed JSON device preset file
+        @rtype: dict
+        @return: The summary
+    """
+    summary = {
+        "make": parsed.get("make", "Generic"),
+        "model": parsed.get("model", ""),
+        "description": parsed.get("description", ""),
+        "version": parsed.get("version", ""),
+        "icon": parsed.get("icon", ""),
+        "default": parsed.get("default", ""),
+        "presets": [],
+    }
+
+    for preset in parsed.get("presets", []):
+        vcodec = preset.get("vcodec", {})
+        summary["presets"].append({
+            "name": preset.get("name", ""),
+            "description": preset.get("description", summary["description"]),
+            "extension": preset.get("extension", ""),
+            "container": preset.get("container", ""),
+            "faststart": preset.get("faststart", None),
+            "vcodec": vcodec.get("name", ""),
+            "acodec": preset.get("acodec", {}).get("name", ""),
+            # The largest output size, with the VideoCodec defaults
+            "width": int((vcodec.get("width") or (2, 1920))[-1]),
+            "height": int((vcodec.get("height") or (2, 1080))[-1]),
+        })
+
+    return summary
+
+
+def _get_index_path():
+    return utils.get_write_path("cache", "presets.json", default=None)
+
+
+def _read_index():
+    path = _get_index_path()
+    if not path or not os.path.exists(path):
+        return {}
+
+    try:
+        with open(path) as f:
+            index = json.load(f)
+    except (OSError, ValueError) as e:
+        _log.debug(_("Ignoring preset index %(path)s: %(error)s") % {
+            "path": path,
+            "error": str(e),
+        })
+        return {}
+
+    if index.get("version") != INDEX_VERSION:
+        return {}
+
+    return index.get("directories", {})
+
+
+def _write_index(directories):
+    path = _get_index_path()
+    if not path:
+        return
+
+    # Write to a temporary file first so parallel runs never read a
+    # partially written index
+    tmp = "%s.%d" % (path, os.getpid())
+    try:
+        with open(tmp, "w") as f:
+            json.dump({"version": INDEX_VERSION, "directories": directories},
+                      f)
+        os.replace(tmp, path)
+    except OSError as e:
+        _log.debug(_("Unable to write preset index %(path)s: %(error)s") % {
+            "path": path,
+            "error": str(e),
+        })
+
+
+def index_directory(directory):
+    """
+        Get the index of a directory of device preset files. The index is
+        cached on disk; when the directory has not been modified since, only
+        the files in it are checked for changes, otherwise it is listed
+        again. Only new or changed files are parsed.
+
+        @type directory: str
+        @param directory: The path to index
+        @rtype: dict
+        @return: A dictionary where the keys are device short names and the
+                 values (filename, summary, stamp) tuples, stamp being the
+                 modification time and size of the file
+    """
+    directory = os.path.abspath(directory)
+    directories = _read_index()
+    cached = directories.get(directory, {})
+    cached_files = cached.get("files", {})
+
+    mtime = os.stat(directory).st_mtime_ns
+    if cached.get("mtime") == mtime:
+        filenames = list(cached_files)
+    else:
+        filenames = [entry.name for entry in os.scandir(directory)
+                     if entry.name.endswith(".json")]
+
+    files = {}
+    changed = cached.get("mtime") != mtime
+    for filename in filenames:
+        full = os.path.join(directory, filename)
+        try:
+            stat = os.stat(full)
+        except OSError:
+            changed = True
+            continue
+
+        entry = cached_files.get(filename)
+        if entry and entry["mtime"] == stat.st_mtime_ns and \
+           entry["size"] == stat.st_size:
+            files[filename] = entry
+            continue
+
+        changed = True
+        try:
+            with open(full) as f:
+                summary = summarize(json.load(f))
+        except (OSError, ValueError) as e:
+            _log.warning(_("Problem loading %(filename)s! %(error)s") % {
+                "filename": filename,
+                "error": str(e),
+            })
+            continue
+
+        files[filename] = {
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "summary": summary,
+        }
+
+    if changed:
+        directories[directory] = {"mtime": mtime, "files": files}
+        _write_index(directories)
+
+    return dict((filename[:-5], (os.path.join(directory, filename),
+                                 entry["summary"],
+                                 (entry["mtime"], entry["size"])))
+                for filename, entry in files.items())
+
+
 def load(filename):
     """
         Load a filename into a new Device.
@@ -524,30 +1117,437 @@ def load(filename):
 
 def load_directory(directory):
     """
-        Load an entire directory of device presets.
+        Add an entire directory of device presets. The devices are loaded
+        from their files when they are accessed.
 
         @type directory: str
         @param directory: The path to load
-        @rtype: dict
+        @rtype: DeviceIndex
         @return: A dictionary of all the loaded devices
     """
-    for filename in os.listdir(directory):
-        if filename.endswith("json"):
-            try:
-                _presets[filename[:-5]] = load(os.path.join(directory, filename))
-            except OSError as e:
-                _log.warning("Problem loading %s! %s" % (filename, str(e)))
-    return _presets
+    presets = get()
+    try:
+        index = index_directory(directory)
+    except OSError as e:
+        _log.warning(_("Problem loading %(directory)s! %(error)s") % {
+            "directory": directory,
+            "error": str(e),
+        })
+        return presets
 
+    presets.update(os.path.abspath(directory), index)
 
-def get():
+    return presets
+
+
+def reload_directory(directory):
+    """
+        Reload a directory of device presets that was loaded before. Only
+        new, changed and removed files are handled, the others are left
+        alone.
+
+        @type directory: str
+        @param directory: The path to reload
+        @rtype: tuple
+        @return: Lists of the added, changed and removed device names
+    """
+    directory = os.path.abspath(directory)
+    try:
+        index = index_directory(directory)
+    except OSError:
+        # The directory is gone, and so are its presets
+        index = {}
+
+    diff = get().update(directory, index)
+
+    _log.debug(_("Reloaded %(directory)s: added %(added)s, changed "
+                 "%(changed)s, removed %(removed)s") % {
+        "directory": directory,
+        "added": diff[0],
+        "changed": diff[1],
+        "removed": diff[2],
+    })
+
+    return diff
+
+
+class PresetMonitor(GObject.GObject):
+    """
+        Watch directories of device presets and reload the files that are
+        added, changed or removed, so running programs pick up new presets
+        without a restart. Changes arriving close together are reloaded at
+        once, after which presets-changed is emitted with the names of the
+        added, changed and removed devices.
+    """
+
+    __gsignals__ = {
+        "presets-changed": (GObject.SignalFlags.RUN_LAST, None,
+                           (GObject.TYPE_PYOBJECT,    # added
+                            GObject.TYPE_PYOBJECT,    # changed
+                            GObject.TYPE_PYOBJECT)),  # removed
+    }
+
+    def __init__(self, directories=None, delay=RELOAD_DELAY):
+        """
+            @type directories: list
+            @param directories: The directories to watch, by default the one
+                                reset() loads presets from
+            @type delay: int
+            @param delay: Milliseconds to wait for more changes before
+                          reloading
+        """
+        super().__init__()
+
+        if directories is None:
+            directories = [utils.get_write_path("presets")]
+
+        self.delay = delay
+
+        self._monitors = []
+        self._pending = set()
+        self._timeout = None
+
+        for directory in directories:
+            directory = os.path.abspath(directory)
+            monitor = Gio.File.new_for_path(directory).monitor_directory(
+                          Gio.FileMonitorFlags.WATCH_MOVES, None)
+            monitor.connect("changed", self._on_changed, directory)
+            self._monitors.append(monitor)
+
+    def _on_changed(self, monitor, changed, other, event, directory):
+        names = [changed.get_basename()]
+        if other:
+            names.append(other.get_basename())
+        if not [x for x in names if x.endswith(".json")]:
+            return
+
+        self._pending.add(directory)
+        if self._timeout is None:
+            self._timeout = GLib.timeout_add(self.delay, self._reload)
+
+    def _reload(self):
+        self._timeout = None
+
+        added, changed, removed = [], [], []
+        for directory in sorted(self._pending):
+            diff = reload_directory(directory)
+            added += diff[0]
+            changed += diff[1]
+            removed += diff[2]
+        self._pending.clear()
+
+        if added or changed or removed:
+            self.emit("presets-changed", added, changed, removed)
+
+        return False
+
+    def cancel(self):
+        """
+            Stop watching the preset directories.
+        """
+        for monitor in self._monitors:
+            monitor.cancel()
+        self._monitors = []
+
+        if self._timeout is not None:
+            GLib.source_remove(self._timeout)
+            self._timeout = None
+
+
+def make_slug(device, name):
+    '''
+    Make a slug for a preset that is safe to use as a filename or in links.
+
+    >>> make_slug("computer", "H.264")
+    'computer-h.264'
+    >>> make_slug("nokia-nseries", "N800 / N810")
+    'nokia-nseries-n800__n810'
+    '''
+    slug = device + "-" + name.lower()
+
+    return slug.replace(" ", "_").replace("'", "").replace("/", "")
+
+
+PresetInfo = namedtuple("PresetInfo", [
+    "slug",         # e.g. computer-h.264
+    "device",       # Device short name, e.g. computer
+    "device_name",  # Friendly device name, e.g. Computer
+    "name",         # Preset name, e.g. H.264
+    "description",
+    "container",    # Muxer element name, e.g. mp4mux
+    "extension",
+    "vcodec",       # Encoder element names, e.g. x264enc
+    "acodec",
+    "width",        # Largest output size
+    "height",
+    "search",       # Lowercase text matched by text queries
+])
+
+
+class PresetRegistry:
+    """
+        Indexes of all presets by device, codec, container, extension and
+        output size, built from the preset index so no device has to be
+        loaded for a query.
+
+            >>> registry = arista.presets.get_registry()
+            >>> [x.slug for x in registry.query(vcodec="h.264",
+            ...                                 max_height=720,
+            ...                                 extension="mp4")]
+            ['android-droid__milestone', ...]
+    """
+    def __init__(self, devices):
+        """
+            @type devices: DeviceIndex
+            @param devices: The devices to index
+        """
+        self.devices = devices
+        self.generation = devices.generation
+
+        self.presets = []
+        self._by_slug = {}
+        self._by_name = {}
+        self._by_device = {}
+        self._by_vcodec = {}
+        self._by_acodec = {}
+        self._by_container = {}
+        self._by_extension = {}
+
+        for device in sorted(devices):
+            summary = devices.summary(device)
+            device_name = summary["make"] == "Generic" and summary["model"] \
+                          or "%s %s" % (summary["make"], summary["model"])
+            for preset in sorted(summary["presets"],
+                                 key=lambda x: x["name"]):
+                info = PresetInfo(
+                    slug=make_slug(device, preset["name"]),
+                    device=device,
+                    device_name=device_name,
+                    name=preset["name"],
+                    description=preset["description"],
+                    container=preset["container"].split(" ")[0],
+                    extension=preset["extension"],
+                    vcodec=preset["vcodec"],
+                    acodec=preset["acodec"],
+                    width=preset["width"],
+                    height=preset["height"],
+                    search="\n".join([device_name, summary["description"],
+                                       preset["name"], preset["vcodec"],
+                                       preset["acodec"]]).lower(),
+                )
+                self._add(info)
+
+        self._widths = sorted((x.width, i) for i, x in enumerate(self.presets))
+        self._heights = sorted((x.height, i)
+                               for i, x in enumerate(self.presets))
+
+    def __len__(self):
+        return len(self.presets)
+
+    def __iter__(self):
+        return iter(self.presets)
+
+    def _add(self, info):
+        index = len(self.presets)
+        self.presets.append(info)
+
+        self._by_slug[info.slug] = info
+        self._by_name["%s - %s" % (info.device_name, info.name)] = info
+        for table, key in ((self._by_device, info.device),
+                           (self._by_vcodec, info.vcodec),
+                           (self._by_acodec, info.acodec),
+                           (self._by_container, info.container),
+                           (self._by_extension, info.extension.lower())):
+            table.setdefault(key, set()).add(index)
+
+    def find(self, name, preset=None):
+        """
+            Find a preset.
+
+            @type name: str
+            @param name: A preset slug, e.g. computer-h.264, a full name as
+                         shown in the GUI, e.g. "Computer - H.264", or a
+                         device short name when preset is given
+            @type preset: str
+            @param preset: A preset name, e.g. H.264
+            @rtype: PresetInfo
+            @return: The preset, or None if there is no such preset
+        """
+        if preset is not None:
+            return self._by_slug.get(make_slug(name, preset))
+
+        return self._by_slug.get(name) or self._by_name.get(name)
+
+    def _codec(self, table, name):
+        name = name.lower()
+        elements = CODEC_ALIASES.get(name.replace(".", "").replace("-", ""),
+                                     (name,))
+        found = set()
+        for element in elements:
+            found |= table.get(element, set())
+        return found
+
+    def _size(self, sizes, low, high):
+        start = 0
+        if low is not None:
+            start = bisect.bisect_left(sizes, (low, -1))
+        end = len(sizes)
+        if high is not None:
+            end = bisect.bisect_right(sizes, (high, len(sizes)))
+        return set(i for size, i in sizes[start:end])
+
+    def query(self, text=None, device=None, vcodec=None, acodec=None,
+              container=None, extension=None, min_width=None,
+              max_width=None, min_height=None, max_height=None):
+        """
+            Find all presets matching every given condition.
+
+            @type text: str
+            @param text: Text to find in the device or preset name, device
+                         description or codec names, ignoring case
+            @type device: str
+            @param device: A device short name
+            @type vcodec: str
+            @param vcodec: A video encoder element or format name from
+                           CODEC_ALIASES, e.g. x264enc or H.264
+            @type acodec: str
+            @param acodec: An audio encoder element or format name
+            @type container: str
+            @param container: A muxer element name, e.g. mp4mux
+            @type extension: str
+            @param extension: The output filename extension, e.g. mp4
+            @type min_width: int
+            @param min_width: Only presets that can output at least this
+                              width
+            @type max_width: int
+            @param max_width: Only presets that output at most this width
+            @type min_height: int
+            @param min_height: Only presets that can output at least this
+                               height
+            @type max_height: int
+            @param max_height: Only presets that output at most this
+                               height, e.g. 720
+            @rtype: list
+            @return: The matching PresetInfo objects
+        """
+        conditions = []
+        if device:
+            conditions.append(self._by_device.get(device, set()))
+        if vcodec:
+            conditions.append(self._codec(self._by_vcodec, vcodec))
+        if acodec:
+            conditions.append(self._codec(self._by_acodec, acodec))
+        if container:
+            conditions.append(self._by_container.get(container, set()))
+        if extension:
+            conditions.append(self._by_extension.get(
+                extension.lower().lstrip("."), set()))
+        if min_width is not None or max_width is not None:
+            conditions.append(self._size(self._widths, min_width, max_width))
+        if min_height is not None or max_height is not None:
+            conditions.append(self._size(self._heights, min_height,
+                                         max_height))
+
+        found = None
+        for condition in conditions:
+            found = condition if found is None else found & condition
+
+        if found is None:
+            results = self.presets
+        else:
+            results = [self.presets[i] for i in sorted(found)]
+
+        if text:
+            text = text.lower().strip()
+            results = [x for x in results if text in x.search]
+
+        return results
+
+
+def get_registry():
+    """
+        Get the preset registry, which is rebuilt when devices have been
+        added or removed.
+
+        @rtype: PresetRegistry
+        @return: The registry of all loaded presets
     """
-        Get all loaded device presets.
+    global _registry
+
+    devices = get()
+    if _registry is None or _registry.devices is not devices or \
+       _registry.generation != devices.generation:
+        _registry = PresetRegistry(devices)
+
+    return _registry
+
+
+def get_element_availability():
+    """
+        Check which of the elements used by the loaded presets are installed.
+        All of them are looked up at once and the result is kept until the
+        GStreamer registry changes, e.g. because plugins were installed, or
+        the presets change.
 
         @rtype: dict
+        @return: Whether each element is installed, by element name
+    """
+    global _availability
+
+    gst_init()
+    registry = get_registry()
+    cookie = Gst.Registry.get().get_feature_list_cookie()
+    if _availability is None or _availability[0] is not registry or \
+       _availability[1] != cookie:
+        names = set(INTERNAL_ELEMENTS)
+        names.add(DEINTERLACER)
+        for info in registry:
+            names.update([x for x in (info.container, info.vcodec,
+                                      info.acodec) if x])
+
+        _availability = (registry, cookie, dict([
+            (name, Gst.ElementFactory.find(name) is not None)
+            for name in names]))
+
+    return _availability[2]
+
+
+def get_missing_elements(elements):
+    """
+        Get which elements are not installed out of a list of elements and
+        the ones the transcoder always uses.
+
+        @type elements: list
+        @param elements: Element names, e.g. the container and encoders of a
+                         preset
+        @rtype: list
+        @return: The names of the missing elements
+    """
+    available = get_element_availability()
+
+    missing = []
+    for element in [x for x in elements if x] + list(INTERNAL_ELEMENTS):
+        if element not in available:
+            # Not used by any preset in the index, e.g. after editing one
+            available[element] = Gst.ElementFactory.find(element) is not None
+        if not available[element] and element not in missing:
+            missing.append(element)
+
+    return missing
+
+
+def get():
+    """
+        Get all loaded device presets, loading the preset index the first
+        time.
+
+        @rtype: DeviceIndex
         @return: A dictionary of Device objects where the keys are the short
                  name for the device
     """
+    if _presets is None:
+        reset()
+
     return _presets
 
 
@@ -561,34 +1561,371 @@ def version_info():
     """
     info = ""
 
-    for name, device in _presets.items():
-        info += "%s, %s\n" % (name, device.version)
+    presets = get()
+    for name in presets:
+        info += "%s, %s\n" % (name, presets.summary(name)["version"])
 
     return info
 
+def get_compression(filename):
+    '''
+    Get the compression of a preset archive from its filename extension.
+
+    >>> get_compression("computer.tar.xz")
+    'xz'
+    >>> get_compression("computer.tbz2")
+    'bz2'
+    >>> get_compression("computer.json") is None
+    True
+    '''
+    for compression, extensions in ARCHIVE_COMPRESSIONS.items():
+        for extension in extensions:
+            if filename.endswith(extension):
+                return compression
+
+    return None
+
+
+def write_archive(stream, directory, names, compression=DEFAULT_COMPRESSION):
+    """
+        Write files from a directory into a compressed tar stream. Nothing
+        depends on the working directory, so this can be used from any
+        thread.
+
+        @type stream: a file-like object
+        @param stream: Where to write the archive
+        @type directory: str
+        @param directory: The directory the files are in
+        @type names: list
+        @param names: The files to write, relative to directory
+        @type compression: str
+        @param compression: One of ARCHIVE_COMPRESSIONS
+    """
+    if compression not in ARCHIVE_COMPRESSIONS:
+        raise ValueError(_("Unknown compression %(compression)s") % {
+            "compression": compression,
+        })
+
+    writer = None
+    mode = "w|" + compression
+    if compression == "zst" and "zst" not in tarfile.TarFile.OPEN_METH:
+        if zstandard is None:
+            raise tarfile.CompressionError(_("zstd compression needs the "
+                                             "zstandard module"))
+        writer = zstandard.ZstdCompressor().stream_writer(stream,
+                                                          closefd=False)
+        mode = "w|"
+
+    with tarfile.open(mode=mode, fileobj=writer or stream) as tar:
+        for name in names:
+            tar.add(os.path.join(directory, name), arcname=name)
+
+    if writer:
+        writer.close()
+
+
+class _PeekedStream:
+    """
+        A stream with bytes that were already read put back in front.
+    """
+    def __init__(self, head, stream):
+        self._head = head
+        self._stream = stream
+
+    def read(self, size=-1):
+        head = self._head
+        if size < 0:
+            self._head = b""
+            return head + self._stream.read()
+
+        self._head = head[size:]
+        head = head[:size]
+        if len(head) < size:
+            head += self._stream.read(size - len(head))
+
+        return head
+
+
 def extract(stream):
     """
-        Extract a preset file into the user's local presets directory.
+        Extract a preset file into the user's local presets directory. The
+        archive is read as a stream and its compression (gzip, bzip2, xz or
+        zstd) is detected from the data.
 
         @type stream: a file-like object
-        @param stream: The opened bzip2-compressed tar file of the preset
+        @param stream: The opened tar file of the preset, opened in binary
+                       mode
         @rtype: list
         @return: The installed device preset shortnames ["name1", "name2", ...]
     """
-    local_path = os.path.expanduser(os.path.join("~", ".arista", "presets"))
+    local_path = _get_local_path()
 
-    if not os.path.exists(local_path):
-        os.makedirs(local_path)
+    # Several fetch workers may extract at once
+    os.makedirs(local_path, exist_ok=True)
 
-    tar = tarfile.open(mode="r|bz2", fileobj=stream)
     _log.debug(_("Extracting %(filename)s") % {
         "filename": hasattr(stream, "name") and stream.name or "data stream",
     })
+
+    magic = stream.read(len(ZSTD_MAGIC))
+    source = _PeekedStream(magic, stream)
+    if magic == ZSTD_MAGIC and "zst" not in tarfile.TarFile.OPEN_METH:
+        if zstandard is None:
+            raise tarfile.CompressionError(_("zstd compression needs the "
+                                             "zstandard module"))
+        source = zstandard.ZstdDecompressor().stream_reader(source)
+
+    tar = tarfile.open(mode="r|*", fileobj=source)
+    if hasattr(tarfile, "data_filter"):
+        # Refuse links and paths outside of the presets directory
+        tar.extraction_filter = tarfile.data_filter
     tar.extractall(path=local_path)
 
     return [x[:-5] for x in tar.getnames() if x.endswith(".json")]
 
 
+def _get_local_path():
+    return os.path.expanduser(os.path.join("~", ".arista", "presets"))
+
+
+def _is_installed(validators):
+    """
+        Check whether the device presets installed from an archive are all
+        still there, so it is safe to skip fetching it again if it has not
+        changed.
+    """
+    names = validators.get("installed")
+    if not names:
+        return False
+
+    local_path = _get_local_path()
+    return all([os.path.exists(os.path.join(local_path, name + ".json"))
+                for name in names])
+
+
+def _get_validators_path():
+    return utils.get_write_path("cache", "fetched.json", default=None)
+
+
+def _read_validators():
+    path = _get_validators_path()
+    if not path or not os.path.exists(path):
+        return {}
+
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        _log.debug(_("Ignoring fetched preset list %(path)s: %(error)s") % {
+            "path": path,
+            "error": str(e),
+        })
+        return {}
+
+
+def _write_validators(validators):
+    path = _get_validators_path()
+    if not path:
+        return
+
+    tmp = "%s.%d" % (path, os.getpid())
+    try:
+        with open(tmp, "w") as f:
+            json.dump(validators, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        _log.debug(_("Unable to write fetched preset list %(path)s: "
+                     "%(error)s") % {
+            "path": path,
+            "error": str(e),
+        })
+
+
+class PresetFetcher:
+    """
+        Download and install preset archives from a preset site, several at
+        once. Every worker thread keeps its connections open between
+        requests, and archives are extracted while they are downloaded.
+
+        The ETag and Last-Modified of each installed archive are stored with
+        the device presets it contained, so later fetches send If-None-Match
+        and If-Modified-Since and archives that have not changed are not
+        transferred again. If any of those presets has been deleted the
+        archive is fetched unconditionally.
+    """
+    def __init__(self, workers=FETCH_WORKERS, timeout=FETCH_TIMEOUT):
+        """
+            @type workers: int
+            @param workers: How many archives to download at once
+            @type timeout: int
+            @param timeout: Seconds to wait for the preset site
+        """
+        self.workers = workers
+        self.timeout = timeout
+
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _get_connection(self, scheme, netloc):
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+
+        if (scheme, netloc) not in connections:
+            if scheme == "https":
+                connection = http.client.HTTPSConnection(netloc,
+                                                         timeout=self.timeout)
+            else:
+                connection = http.client.HTTPConnection(netloc,
+                                                        timeout=self.timeout)
+            connections[(scheme, netloc)] = connection
+            with self._lock:
+                self._connections.append(connection)
+
+        return connections[(scheme, netloc)]
+
+    def _open(self, url, headers):
+        for i in range(FETCH_MAX_REDIRECTS + 1):
+            parts = urllib.parse.urlsplit(url)
+            if parts.scheme not in ("http", "https"):
+                raise OSError(_("Unsupported location %(url)s") % {
+                    "url": url,
+                })
+
+            path = parts.path or "/"
+            if parts.query:
+                path += "?" + parts.query
+
+            connection = self._get_connection(parts.scheme, parts.netloc)
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+            except (http.client.HTTPException, OSError):
+                # The server may have closed a kept-alive connection, so try
+                # once more on a new one
+                connection.close()
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+
+            location = response.getheader("Location")
+            if response.status in (301, 302, 303, 307, 308) and location:
+                response.read()
+                url = urllib.parse.urljoin(url, location)
+                continue
+
+            return connection, response
+
+        raise OSError(_("Too many redirects fetching %(url)s") % {
+            "url": url,
+        })
+
+    def _fetch(self, url, validators):
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last-modified"):
+            headers["If-Modified-Since"] = validators["last-modified"]
+
+        _log.debug(_("Fetching %(location)s") % {
+            "location": url,
+        })
+
+        connection, response = self._open(url, headers)
+        try:
+            if response.status == 304:
+                response.read()
+                _log.debug(_("%(location)s has not changed") % {
+                    "location": url,
+                })
+                return ([], validators)
+
+            if response.status != 200:
+                raise OSError("%d %s" % (response.status, response.reason))
+
+            updated = extract(response)
+
+            # Read what the tar reader left, so the connection can be reused
+            response.read()
+        except:
+            connection.close()
+            raise
+
+        validators = {"installed": updated}
+        if response.getheader("ETag"):
+            validators["etag"] = response.getheader("ETag")
+        if response.getheader("Last-Modified"):
+            validators["last-modified"] = response.getheader("Last-Modified")
+
+        return (updated, validators)
+
+    def fetch(self, location, names):
+        """
+            Fetch and install presets. Presets are always installed to
+            ~/.arista/presets/.
+
+            @type location: str
+            @param location: The location of the presets
+            @type names: list
+            @param names: The names of the presets to fetch, without any
+                          extension
+            @rtype: list
+            @return: The installed device preset shortnames
+                     ["name1", "name2", ...]
+        """
+        if not location.endswith("/"):
+            location = location + "/"
+
+        urls = [location + name + ".tar.bz2" for name in names]
+        stored = _read_validators()
+
+        updated = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = []
+                for url in urls:
+                    validators = stored.get(url, {})
+                    if not _is_installed(validators):
+                        validators = {}
+                    futures.append((url, executor.submit(self._fetch, url,
+                                                         validators)))
+
+                for url, future in futures:
+                    try:
+                        installed, validators = future.result()
+                    except (OSError, http.client.HTTPException,
+                            tarfile.TarError) as e:
+                        _log.warning(_("There was an error fetching and "
+                                       "installing %(location)s: "
+                                       "%(error)s") % {
+                            "location": url,
+                            "error": str(e),
+                        })
+                        continue
+
+                    updated += installed
+                    if validators.get("etag") or \
+                       validators.get("last-modified"):
+                        stored[url] = validators
+                    else:
+                        stored.pop(url, None)
+        finally:
+            self.close()
+
+        _write_validators(stored)
+
+        return updated
+
+    def close(self):
+        """
+            Close the connections to the preset site.
+        """
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+
+
 def fetch(location, name):
     """
         Attempt to fetch and install a preset. Presets are always installed
@@ -601,40 +1938,36 @@ def fetch(location, name):
         @rtype: list
         @return: The installed device preset shortnames ["name1", "name2", ...]
     """
-    if not location.endswith("/"):
-        location = location + "/"
+    return fetch_all(location, [name])
 
-    path = location + name + ".tar.bz2"
-    _log.debug(_("Fetching %(location)s") % {
-        "location": path,
-    })
 
-    updated = []
-
-    try:
-        f = urllib.request.urlopen(path)
-        updated += extract(f)
-    except OSError as e:
-        _log.warning(_("There was an error fetching and installing " \
-                       "%(location)s: %(error)s") % {
-            "location": path,
-            "error": str(e),
-        })
+def fetch_all(location, names, workers=FETCH_WORKERS):
+    """
+        Fetch and install several presets at once, skipping the ones that
+        have not changed since they were last fetched. See PresetFetcher.
 
-    return updated
+        @type location: str
+        @param location: The location of the presets
+        @type names: list
+        @param names: The names of the presets to fetch, without any extension
+        @type workers: int
+        @param workers: How many presets to download at once
+        @rtype: list
+        @return: The installed device preset shortnames ["name1", "name2", ...]
+    """
+    return PresetFetcher(workers).fetch(location, names)
 
 
 def reset(overwrite=False, ignore_initial=False):
     # Automatically load presets
     global _presets
 
-    _presets = {}
+    _presets = DeviceIndex()
 
     load_path = utils.get_write_path("presets")
     if ignore_initial or not os.path.exists(os.path.join(load_path, ".initial_complete")):
         # Do initial population of presets from system install / cwd
-        if not os.path.exists(load_path):
-            os.makedirs(load_path)
+        os.makedirs(load_path, exist_ok=True)
 
         # Write file to say we have done this
         open(os.path.join(load_path, ".initial_complete"), "w").close()
@@ -657,7 +1990,7 @@ def reset(overwrite=False, ignore_initial=False):
 
 
 def parse_pass(pas):
-    pairs = pas.split()
+    pairs = shlex.split(pas)
     d = OrderedDict()
     for p in pairs:
         k, v = p.split('=', 1)
@@ -666,12 +1999,154 @@ def parse_pass(pas):
 
 
 def make_pass_from_dict(d):
+    '''
+    Make a pass string from properties, quoting values where needed.
+
+    >>> make_pass_from_dict(OrderedDict([("pass", "cbr"),
+    ...                                  ("tune", "zerolatency fastdecode")]))
+    'pass=cbr tune="zerolatency fastdecode"'
+    '''
     out = []
     for k, v in d.items():
+        v = str(v)
+        if not v or any(c.isspace() or c in "\"'\\" for c in v):
+            v = '"%s"' % v.replace("\\", "\\\\").replace('"', '\\"')
         out.append('{}={}'.format(k, v))
     return ' '.join(out)
 
 
+def compile_pass(pas):
+    '''
+    Compile a preset pass string into an EncoderPass, filling in variables
+    such as %(threads)s. Property names use dashes like GObject does.
+
+    >>> pas = compile_pass("pass=cbr bitrate=2048 ! video/x-h264")
+    >>> list(pas.properties.items()), pas.caps
+    ([('pass', 'cbr'), ('bitrate', '2048')], 'video/x-h264')
+    >>> compile_pass("threads=%(threads)s").properties["threads"] == \\
+    ...     str(CPU_COUNT)
+    True
+    >>> compile_pass('tune="zerolatency fastdecode"').properties["tune"]
+    'zerolatency fastdecode'
+    >>> compile_pass("bitrate")
+    Traceback (most recent call last):
+        ...
+    arista.presets.PresetError: Invalid property bitrate in pass bitrate
+    '''
+    try:
+        filled = pas % PASS_VARIABLES
+    except (KeyError, ValueError, TypeError) as e:
+        raise PresetError(_("Invalid variable %(variable)s in pass "
+                            "%(pass)s") % {
+            "variable": str(e),
+            "pass": pas,
+        })
+
+    props, sep, caps = filled.partition("!")
+    try:
+        items = shlex.split(props)
+    except ValueError as e:
+        raise PresetError(_("Invalid pass %(pass)s: %(error)s") % {
+            "pass": pas,
+            "error": str(e),
+        })
+
+    properties = OrderedDict()
+    for item in items:
+        key, sep, value = item.partition("=")
+        if not key or not sep:
+            raise PresetError(_("Invalid property %(property)s in pass "
+                                "%(pass)s") % {
+                "property": item,
+                "pass": pas,
+            })
+        properties[key.replace("_", "-")] = value
+
+    return EncoderPass(properties, caps.strip())
+
+
+def get_property_specs(element):
+    '''
+    Get the property specs of an element by property name. They are cached,
+    so each element is only created once to look at its properties.
+
+    @type element: str
+    @param element: The element name, e.g. x264enc
+    @rtype: dict
+    @return: GObject.ParamSpec by property name, or None if the element is
+             not available
+    '''
+    if element not in _property_specs:
+        gst_init()
+        instance = Gst.ElementFactory.make(element, None)
+        if instance is None:
+            # Not cached, it may still get installed
+            return None
+        _property_specs[element] = dict([(spec.name, spec) for spec in
+                                         instance.list_properties()])
+
+    return _property_specs[element]
+
+
+def convert_property(spec, value):
+    '''
+    Convert a property value from a pass string to the type of an element
+    property. Booleans, numbers and enums are converted and checked, other
+    values are returned unchanged.
+
+    @type spec: GObject.ParamSpec
+    @param spec: The property spec
+    @type value: str
+    @param value: The value from the pass string
+    @return: The converted value
+    @raise ValueError: The value is invalid for the property
+    '''
+    if not isinstance(value, str):
+        return value
+
+    fundamental = spec.value_type.fundamental
+    if fundamental == GObject.TYPE_BOOLEAN:
+        lowered = value.lower()
+        if lowered in ("true", "yes", "t", "1"):
+            return True
+        if lowered in ("false", "no", "f", "0"):
+            return False
+        raise ValueError(_("not a boolean"))
+
+    if fundamental == GObject.TYPE_ENUM:
+        enum_values = getattr(type(spec.default_value), "__enum_values__",
+                              None)
+        if not enum_values:
+            return value
+        for number, member in enum_values.items():
+            if value in (member.value_nick, member.value_name, str(number)):
+                return number
+        raise ValueError(_("not one of %(values)s") % {
+            "values": ", ".join([x.value_nick for x in enum_values.values()]),
+        })
+
+    if fundamental in INTEGER_TYPES:
+        if value.lower().startswith("0x"):
+            converted = int(value, 16)
+        else:
+            converted = int(value)
+    elif fundamental in FLOAT_TYPES:
+        converted = float(value)
+    else:
+        return value
+
+    minimum = getattr(spec, "minimum", None)
+    maximum = getattr(spec, "maximum", None)
+    if (minimum is not None and converted < minimum) or \
+       (maximum is not None and converted > maximum):
+        raise ValueError(_("not between %(minimum)s and %(maximum)s") % {
+            "minimum": minimum,
+            "maximum": maximum,
+        })
+
+    return converted
+
+
 def remove_param_from_passes(passes, key):
     '''
     Remove key=value from codec passess
@@ -685,10 +2160,12 @@ def remove_param_from_passes(passes, key):
     return out
 
 
+@functools.lru_cache(maxsize=None)
 def is_ubuntu_gst_64bit():
     '''
     Test if we are running with GStreamer 64bit on Ubuntu.
     This test is used for determining if we need to replace faac with avenc_aac.
+    The result is cached, as the platform checks are slow.
     '''
     # Return if we are not on Linux
     if sys.platform != 'linux':
@@ -696,8 +2173,12 @@ def is_ubuntu_gst_64bit():
     # Return if running Python is not 64bit
     if platform.architecture()[0] != '64bit':
         return False
-    # Return if we are not on Ubuntu
-    if platform.dist()[0] != 'Ubuntu':
+    # Return if we are not on Ubuntu. platform.dist() is gone since Python
+    # 3.8, so read os-release instead.
+    try:
+        if platform.freedesktop_os_release().get('ID') != 'ubuntu':
+            return False
+    except (AttributeError, OSError):
         return False
     # Return True if GStreamer version is <= 1.8.1
     if tuple(Gst.version())[:3] <= (1, 8, 1):
@@ -717,6 +2198,3 @@ def faac_to_avenc_aac(adic):
         adic['passes'] = ['compliance=experimental']
     adic['container'] = 'qtmux'
     return adic
-
-
-reset()
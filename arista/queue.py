@@ -39,10 +39,14 @@ from gi.repository import GObject
 from gi.repository import Gst
 
 from .transcoder import Transcoder
+from .utils import OutputAllocator
 
 _ = gettext.gettext
 _log = logging.getLogger("arista.queue")
 
+# How many entries from a feed are kept waiting in the queue
+PENDING_ENTRIES = 16
+
 
 class QueueEntry:
     """
@@ -55,6 +59,9 @@ class QueueEntry:
         """
         self.options = options
 
+        # Set when the entry starts; entries rejected before that have none
+        self.transcoder = None
+
         # Set when QueueEntry.stop() was called so you can react accordingly
         self.force_stopped = False
 
@@ -69,9 +76,8 @@ class QueueEntry:
         """
             Stop this queue entry from processing.
         """
-        if hasattr(self, "transcoder") and self.transcoder.pipe:
-            self.transcoder.pipe.send_event(Gst.Event.new_eos())
-            self.transcoder.start()
+        if self.transcoder and self.transcoder.pipe:
+            self.transcoder.cancel()
 
             self.force_stopped = True
 
@@ -100,18 +106,24 @@ class TranscodeQueue(GObject.GObject):
                         GObject.TYPE_PYOBJECT,)),      # errorstr
         "entry-complete": (GObject.SignalFlags.RUN_LAST, None,
                           (GObject.TYPE_PYOBJECT,)),   # QueueEntry
+        "feed-done": (GObject.SignalFlags.RUN_LAST, None, ()),
     }
 
-    def __init__(self, check_interval = 500):
+    def __init__(self, check_interval = 500, allocator = None):
         """
             Create a new queue, setup locks, and register a callback.
 
             @type check_interval: int
             @param check_interval: The interval in milliseconds between
                                    checking for new queue items
+            @type allocator: OutputAllocator
+            @param allocator: Picks output filenames for entries; the names
+                              it handed out are claimed when an entry starts
         """
         super().__init__()
+        self.allocator = allocator or OutputAllocator()
         self._queue = []
+        self._feeds = []
         self.running = True
         self.pipe_running = False
         self.enc_pass = 0
@@ -168,6 +180,47 @@ class TranscodeQueue(GObject.GObject):
         self._queue.append(QueueEntry(options))
         self.emit("entry-added", self._queue[-1])
 
+    def feed(self, source, pending = PENDING_ENTRIES):
+        """
+            Append entries lazily from an iterable of TranscoderOptions,
+            e.g. a generator walking a directory tree. Only up to pending
+            entries are kept waiting in the queue; more are taken from the
+            source as entries finish. Feeds are used one after the other
+            and feed-done is emitted when one runs out.
+
+            @type source: iterable
+            @param source: The TranscoderOptions to append
+            @type pending: int
+            @param pending: How many entries to keep waiting in the queue
+        """
+        self._feeds.append((iter(source), pending))
+        self._fill()
+
+    @property
+    def feeding(self):
+        """
+            Whether entries are still to come from a feed.
+        """
+        return bool(self._feeds)
+
+    def _fill(self):
+        """
+            Take entries from the current feed until enough are waiting.
+        """
+        while self._feeds:
+            source, pending = self._feeds[0]
+            while len(self._queue) < pending:
+                try:
+                    options = next(source)
+                except StopIteration:
+                    break
+                self.append(options)
+            else:
+                return
+
+            self._feeds.pop(0)
+            self.emit("feed-done")
+
     def remove(self, entry):
         """
             Remove a QueueEntry from the queue.
@@ -182,6 +235,8 @@ class TranscodeQueue(GObject.GObject):
             for each item so that each encode is executed after the previous
             has finished.
         """
+        self._fill()
+
         item = None
         if len(self._queue) and not self.pipe_running:
             item = self._queue[0]
@@ -189,12 +244,40 @@ class TranscodeQueue(GObject.GObject):
             _log.debug(_("Found item in queue! Queue is %(queue)s" % {
                 "queue": str(self)
             }))
+            missing = item.options.preset.get_missing(
+                deinterlace=item.options.force_deinterlace)
+            if missing:
+                # Reject the entry before discovering the input, as it can't
+                # be encoded anyway
+                self.emit("entry-error", item, _("Missing elements: %(elements)s") % {
+                    "elements": ", ".join(missing),
+                })
+                self._queue.pop(0)
+                return True
+
+            error = item.options.preset.error
+            if error:
+                self.emit("entry-error", item, _("Invalid preset: %(error)s") % {
+                    "error": error,
+                })
+                self._queue.pop(0)
+                return True
+
+            try:
+                item.options.output_uri = \
+                    self.allocator.claim(item.options.output_uri)
+            except OSError as e:
+                self.emit("entry-error", item, str(e))
+                self._queue.pop(0)
+                return True
+
             item.transcoder =  Transcoder(item.options)
             item.transcoder.connect("complete", self._on_complete)
 
             def discovered(transcoder, info, is_media):
                 self.emit("entry-discovered", item, info, is_media)
                 if not is_media:
+                    self.allocator.release(item.options.output_uri)
                     self.emit("entry-error", item, _("Not a recognized media file!"))
                     self._queue.pop(0)
                     self.pipe_running = False
@@ -205,6 +288,7 @@ class TranscodeQueue(GObject.GObject):
                     self.emit("entry-start", item)
 
             def error(transcoder, errorstr):
+                self.allocator.release(item.options.output_uri)
                 self.emit("entry-error", item, errorstr)
                 self._queue.pop(0)
                 self.pipe_running = False
@@ -219,6 +303,8 @@ class TranscodeQueue(GObject.GObject):
         """
             An entry is complete!
         """
+        if transcoder.cancelled:
+            self.allocator.release(self._queue[0].options.output_uri)
         self.emit("entry-complete", self._queue[0])
         self._queue.pop(0)
         self.pipe_running = False
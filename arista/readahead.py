@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+"""
+    Arista Input Read-Ahead
+    =======================
+    Read inputs in large blocks and tell the kernel which part of a file
+    will be read next, so that parallel jobs reading from network or
+    spinning storage get long sequential reads instead of interleaved
+    small ones.
+
+    License
+    -------
+    Copyright 2008 - 2011 Daniel G. Taylor <dan@programmer-art.org>
+
+    This file is part of Arista.
+
+    Arista is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as
+    published by the Free Software Foundation, either version 2.1 of
+    the License, or (at your option) any later version.
+
+    Arista is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with Arista.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import gettext
+import logging
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+_ = gettext.gettext
+_log = logging.getLogger("arista.readahead")
+
+# Block size sources read with when read-ahead is enabled
+READAHEAD_BLOCKSIZE = 1024 * 1024
+
+# Default read-ahead window in bytes
+READAHEAD_WINDOW = 16 * 1024 * 1024
+
+
+class ReadAhead(object):
+    """
+        Read-ahead for a source element. Any source gets a large block size;
+        for local files the window in front of the current read position is
+        requested from the kernel with posix_fadvise(WILLNEED), and the data
+        a window behind it can optionally be dropped from the page cache
+        with posix_fadvise(DONTNEED).
+    """
+    def __init__(self, window=READAHEAD_WINDOW, drop_behind=False,
+                 blocksize=READAHEAD_BLOCKSIZE):
+        """
+            @type window: int
+            @param window: How many bytes to read ahead
+            @type drop_behind: bool
+            @param drop_behind: Drop data that has been read from the page
+                                cache, so one large input doesn't push out
+                                the data of other jobs. Don't use it when
+                                the input is read again, e.g. in a later
+                                pass.
+            @type blocksize: int
+            @param blocksize: How many bytes the source reads at once
+        """
+        self.window = window
+        self.drop_behind = drop_behind
+        self.blocksize = blocksize
+
+        self._fd = None
+        self._position = 0
+        self._ahead = 0
+        self._dropped = 0
+
+    def attach(self, source):
+        """
+            Set up read-ahead for a source element, e.g. from the
+            uridecodebin source-setup signal.
+
+            @type source: Gst.Element
+            @param source: The source element
+        """
+        if source.find_property("blocksize"):
+            source.set_property("blocksize", self.blocksize)
+
+        factory = source.get_factory()
+        if not factory or factory.get_name() != "filesrc" or \
+           not hasattr(os, "posix_fadvise"):
+            return
+
+        self.close()
+        try:
+            self._fd = os.open(source.get_property("location"), os.O_RDONLY)
+        except OSError as e:
+            _log.debug(_("No read-ahead hints for %(location)s: %(error)s") % {
+                "location": source.get_property("location"),
+                "error": str(e),
+            })
+            return
+
+        self._position = 0
+        self._ahead = 0
+        self._dropped = 0
+        source.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER,
+                                               self._on_probe)
+
+    def close(self):
+        """
+            Close the file used to give hints.
+        """
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _advise(self, offset, length, advice):
+        try:
+            os.posix_fadvise(self._fd, offset, length, advice)
+        except OSError:
+            pass
+
+    def _on_probe(self, pad, info):
+        if self._fd is None:
+            return Gst.PadProbeReturn.OK
+
+        buf = info.get_buffer()
+        offset = buf.offset
+        if offset == Gst.BUFFER_OFFSET_NONE:
+            offset = self._position
+        self._position = offset + buf.get_size()
+
+        # Refill when half the window has been read, or after seeking
+        left = self._ahead - self._position
+        if left < self.window // 2 or left > self.window:
+            self._advise(self._position, self.window, os.POSIX_FADV_WILLNEED)
+            self._ahead = self._position + self.window
+
+        if self.drop_behind:
+            # Demuxers may read a little backwards, so keep one window
+            behind = offset - self.window
+            if behind < self._dropped:
+                self._dropped = max(behind, 0)
+            elif behind - self._dropped >= self.window:
+                self._advise(self._dropped, behind - self._dropped,
+                             os.POSIX_FADV_DONTNEED)
+                self._dropped = behind
+
+        return Gst.PadProbeReturn.OK
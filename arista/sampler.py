@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+"""
+    Arista Frame Sampler
+    ====================
+    Grab a few decoded frames spread over an input by seeking to them, so
+    they can be analysed without decoding the whole input.
+
+    License
+    -------
+    Copyright 2008 - 2011 Daniel G. Taylor <dan@programmer-art.org>
+
+    This file is part of Arista.
+
+    Arista is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as
+    published by the Free Software Foundation, either version 2.1 of
+    the License, or (at your option) any later version.
+
+    Arista is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with Arista.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+import gettext
+import logging
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import GLib
+from gi.repository import Gst
+
+from . import init as gst_init
+
+_ = gettext.gettext
+_log = logging.getLogger("arista.sampler")
+
+# How long to wait for the input to preroll before seeking, in nanoseconds
+PREROLL_TIMEOUT = Gst.SECOND * 10
+
+
+def sample_frames(source, duration, samples=6, timeout=Gst.SECOND * 2,
+                  caps="video/x-raw,format=GRAY8"):
+    '''
+    Seek to a number of positions evenly spread over the input and yield the
+    decoded frame at each one. Only the frames at the seek positions are
+    decoded, not the whole input.
+
+    @type source: str
+    @param source: A gst-launch source with a name=dmux decoder, as returned
+                   by Transcoder._get_source
+    @type duration: int
+    @param duration: The input duration in nanoseconds, 0 if unknown in
+                     which case only the first frame is sampled
+    @type samples: int
+    @param samples: The number of frames to grab
+    @type timeout: int
+    @param timeout: How long to wait for each frame in nanoseconds
+    @type caps: str
+    @param caps: The single plane raw format, and optionally size, to
+                 convert and scale frames to
+    @rtype: generator
+    @return: Tuples of (data, width, height, stride)
+    '''
+    gst_init()
+
+    cmd = "%s dmux. ! queue ! videoconvert ! videoscale ! %s ! " \
+          "appsink name=sink sync=false max-buffers=1 drop=true" % \
+          (source, caps)
+
+    try:
+        pipe = Gst.parse_launch(cmd)
+    except GLib.GError as e:
+        _log.warning(_("Unable to sample frames: %(error)s") % {
+            "error": str(e),
+        })
+        return
+
+    sink = pipe.get_by_name("sink")
+
+    if duration and duration > 0:
+        positions = [duration * (i + 1) // (samples + 1)
+                     for i in range(samples)]
+    else:
+        positions = [None]
+
+    try:
+        # Seeks only work once the pipeline has prerolled
+        pipe.set_state(Gst.State.PAUSED)
+        ret = pipe.get_state(PREROLL_TIMEOUT)[0]
+        if ret not in (Gst.StateChangeReturn.SUCCESS,
+                       Gst.StateChangeReturn.NO_PREROLL):
+            _log.warning(_("Unable to sample frames: the input did not " \
+                           "preroll"))
+            return
+
+        for position in positions:
+            if position is not None and \
+               not pipe.seek_simple(Gst.Format.TIME, Gst.SeekFlags.FLUSH |
+                                    Gst.SeekFlags.KEY_UNIT, position):
+                _log.debug(_("Unable to seek to %(position)d, skipping " \
+                             "sample") % {
+                    "position": position,
+                })
+                continue
+
+            if pipe.get_state(timeout)[0] == Gst.StateChangeReturn.FAILURE:
+                return
+
+            sample = sink.emit("pull-preroll")
+            if not sample:
+                continue
+
+            frame = get_frame(sample)
+            if frame:
+                yield frame
+    finally:
+        pipe.set_state(Gst.State.NULL)
+
+
+def get_frame(sample):
+    '''
+    Get the data of a single plane raw video sample.
+
+    @type sample: Gst.Sample
+    @param sample: The sample, e.g. pulled from an appsink
+    @rtype: tuple
+    @return: A tuple of (data, width, height, stride) or None on errors
+    '''
+    struct = sample.get_caps().get_structure(0)
+    width = struct.get_int("width")[1]
+    height = struct.get_int("height")[1]
+
+    buf = sample.get_buffer()
+    success, mapinfo = buf.map(Gst.MapFlags.READ)
+    if not success:
+        return None
+    try:
+        data = bytes(mapinfo.data)
+    finally:
+        buf.unmap(mapinfo)
+
+    # Rows are padded, e.g. to a multiple of four bytes
+    return data, width, height, len(data) // height
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+
+"""
+    Arista Streamed Input and Output
+    ================================
+    Support for reading input from stdin or an open file descriptor and
+    writing output to one or to the network, e.g. when media arrives from
+    another process or goes straight to an uploader or to viewers.
+
+    Pipes can only be read once, but the input is read once for discovery
+    and again for each encoding pass. A StreamReader therefore records the
+    data read during discovery and replays it to the encoding pipeline
+    before carrying on with the rest of the stream.
+
+    License
+    -------
+    Copyright 2008 - 2011 Daniel G. Taylor <dan@programmer-art.org>
+
+    This file is part of Arista.
+
+    Arista is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as
+    published by the Free Software Foundation, either version 2.1 of
+    the License, or (at your option) any later version.
+
+    Arista is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with Arista.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import re
+import gettext
+import logging
+import urllib.parse
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+from .utils import get_friendly_size
+
+_ = gettext.gettext
+_log = logging.getLogger("arista.streams")
+
+# Name used for standard input / output instead of a filename
+STDIO = "-"
+
+# Extra muxer settings to write output that doesn't need seeking back
+STREAMABLE_MUXERS = {
+    "mp4mux": "streamable=true fragment-duration=1000",
+    "qtmux": "streamable=true fragment-duration=1000",
+    "matroskamux": "streamable=true",
+    "webmmux": "streamable=true",
+    "flvmux": "streamable=true",
+}
+
+# Network output schemes and the sinks they map to
+NETWORK_SINKS = {
+    "udp": "udpsink",
+    "rtp": "udpsink",
+    "tcp": "tcpserversink",
+    "srt": "srtsink",
+}
+
+# Muxers that can't be streamed over the network are replaced by MPEG-TS
+NETWORK_UNSAFE_MUXERS = ("mp4mux", "qtmux", "avimux", "avmux_dvd",
+                         "ffmux_dvd")
+
+# RTP payloaders for encoder elements
+RTP_PAYLOADERS = {
+    "x264enc": "rtph264pay config-interval=1",
+    "vp8enc": "rtpvp8pay",
+    "vp9enc": "rtpvp9pay",
+    "theoraenc": "rtptheorapay",
+    "xvidenc": "rtpmp4vpay",
+    "avenc_mpeg4": "rtpmp4vpay",
+    "mpeg2enc": "rtpmpvpay",
+    "vorbisenc": "rtpvorbispay",
+    "faac": "rtpmp4apay",
+    "avenc_aac": "rtpmp4apay",
+    "voaacenc": "rtpmp4apay",
+    "lamemp3enc": "rtpmpapay",
+    "twolame": "rtpmpapay",
+    "opusenc": "rtpopuspay",
+    "avenc_ac3": "rtpac3pay",
+}
+
+# How much of a streamed input may be kept in memory while discovering it,
+# e.g. an MP4 file with its index at the end has to be read completely
+MAX_RECORDING = 64 * 1024 * 1024
+
+# Sink settings given in a network URI query must be plain values
+RE_SAFE_VALUE = re.compile(r'^[\w.:-]+$')
+
+
+def is_stream(uri):
+    """
+        Check whether a location is stdin/stdout or a file descriptor.
+
+        @type uri: str
+        @param uri: The input or output location
+        @rtype: bool
+        @return: True if the location can only be read or written once
+    """
+    return uri == STDIO or uri.startswith("fd://")
+
+
+def get_fd(uri, default):
+    '''
+    Get the file descriptor number of a stream location.
+
+    >>> get_fd("fd://3", 1)
+    3
+    >>> get_fd("-", 1)
+    1
+    >>> get_fd("fd://abc", 1)
+    Traceback (most recent call last):
+        ...
+    ValueError: Invalid file descriptor in fd://abc
+
+    @type uri: str
+    @param uri: Either "-" or fd://N
+    @type default: int
+    @param default: The descriptor to use for "-", e.g. 0 for input
+    @rtype: int
+    @return: The file descriptor number
+    @raise ValueError: The location has no valid descriptor number
+    '''
+    if uri == STDIO:
+        return default
+
+    try:
+        fd = int(uri[5:])
+    except ValueError:
+        fd = -1
+
+    if fd < 0:
+        raise ValueError(_("Invalid file descriptor in %(uri)s") % {
+            "uri": uri,
+        })
+
+    return fd
+
+
+def get_streamable_muxer(container):
+    """
+        Get a muxer description that writes output which can be streamed,
+        i.e. without seeking back to write headers or indexes.
+
+        @type container: str
+        @param container: The muxer description from the preset
+        @rtype: str
+        @return: The muxer description with extra settings if needed
+    """
+    extra = STREAMABLE_MUXERS.get(container.split()[0])
+    if extra:
+        return "%s %s" % (container, extra)
+
+    return container
+
+
+def is_network(uri):
+    """
+        Check whether an output location is a network stream, e.g.
+        udp://host:port, rtp://host:port, tcp://host:port or srt://host:port.
+
+        @type uri: str
+        @param uri: The output location
+        @rtype: bool
+        @return: True if the output should be sent over the network
+    """
+    return uri.split("://")[0] in NETWORK_SINKS and "://" in uri
+
+
+def is_rtp(uri):
+    """
+        Check whether an output location sends RTP, which is payloaded per
+        stream instead of muxed.
+    """
+    return uri.startswith("rtp://")
+
+
+def get_network_muxer(container):
+    """
+        Get a muxer description that can be sent over the network. Muxers
+        that need to seek back are replaced by MPEG-TS.
+
+        @type container: str
+        @param container: The muxer description from the preset
+        @rtype: str
+        @return: A streamable muxer description
+    """
+    if container.split()[0] in NETWORK_UNSAFE_MUXERS:
+        return "mpegtsmux alignment=7"
+
+    return get_streamable_muxer(container)
+
+
+def get_network_sink(uri, name="sink", stream=0):
+    """
+        Get a sink description for a network output location. Settings for
+        the sink, like send buffer size or latency, can be given as query
+        parameters, e.g. udp://host:1234?buffer-size=1048576 or
+        srt://host:1234?latency=200.
+
+        @type uri: str
+        @param uri: The output location
+        @type name: str
+        @param name: The name of the sink element
+        @type stream: int
+        @param stream: For RTP, the index of the stream, which is sent to
+                       the port plus twice this number
+        @rtype: str
+        @return: A sink element usable with Gst.parse_launch
+        @raise ValueError: The location or its settings are invalid
+    """
+    parts = urllib.parse.urlsplit(uri)
+    port = parts.port
+    if not port:
+        raise ValueError(_("No port given in %(uri)s") % {"uri": uri})
+
+    sink = NETWORK_SINKS[parts.scheme]
+    if parts.scheme == "srt":
+        # Without a host SRT listens for callers
+        props = ["uri=\"srt://%s:%d\"" % (parts.hostname or "", port)]
+    else:
+        props = ["host=%s" % (parts.hostname or "127.0.0.1"),
+                 "port=%d" % (port + 2 * stream)]
+
+    for key, value in urllib.parse.parse_qsl(parts.query):
+        if not RE_SAFE_VALUE.match(key) or not RE_SAFE_VALUE.match(value):
+            raise ValueError(_("Invalid setting %(key)s=%(value)s") % {
+                "key": key,
+                "value": value,
+            })
+        props.append("%s=%s" % (key, value))
+
+    return "%s name=%s %s" % (sink, name, " ".join(props))
+
+
+def get_rtp_sink(encoder, uri, stream):
+    """
+        Get a payloader and sink description to send one encoded stream as
+        RTP.
+
+        @type encoder: str
+        @param encoder: The encoder element name, e.g. x264enc
+        @type uri: str
+        @param uri: The rtp://host:port output location
+        @type stream: int
+        @param stream: The index of the stream, 0 for video and 1 for audio
+        @rtype: str
+        @return: Elements usable with Gst.parse_launch
+        @raise ValueError: There is no payloader for the encoder
+    """
+    if encoder not in RTP_PAYLOADERS:
+        raise ValueError(_("Can't send %(encoder)s output as RTP") % {
+            "encoder": encoder,
+        })
+
+    return "%s pt=%d ! %s" % (RTP_PAYLOADERS[encoder], 96 + stream,
+                              get_network_sink(uri, "sink%d" % stream, stream))
+
+
+class StreamReader(object):
+    """
+        Read from a file descriptor into appsrc elements. Everything read is
+        recorded until rewind() is called, which replays it to the next
+        appsrc before reading on. If more than max_recording bytes have to
+        be recorded the stream ends early and overflowed is set, as it
+        can't be replayed.
+    """
+    def __init__(self, fd, blocksize=65536, max_recording=MAX_RECORDING):
+        """
+            @type fd: int
+            @param fd: The file descriptor to read from
+            @type blocksize: int
+            @param blocksize: How many bytes to read at once
+            @type max_recording: int
+            @param max_recording: How many bytes may be recorded
+        """
+        self.fd = fd
+        self.blocksize = blocksize
+        self.max_recording = max_recording
+
+        self.recording = True
+        self.overflowed = False
+        self._recorded = []
+        self._recorded_size = 0
+        self._replay = []
+
+    def attach(self, appsrc):
+        """
+            Feed an appsrc element from this reader.
+
+            @type appsrc: Gst.Element
+            @param appsrc: The appsrc element to feed
+        """
+        appsrc.set_property("format", Gst.Format.BYTES)
+        appsrc.connect("need-data", self._on_need_data)
+
+    def rewind(self):
+        """
+            Stop recording and replay what has been read so far to the next
+            attached appsrc.
+
+            @raise ValueError: More than max_recording bytes were read, so
+                               the data can't be replayed
+        """
+        if self.overflowed:
+            raise ValueError(_("More than %(size)s of the input had to be "
+                               "read to recognize it") % {
+                "size": get_friendly_size(self.max_recording),
+            })
+
+        self.recording = False
+        self._replay = self._recorded
+        self._recorded = []
+
+    def read(self):
+        """
+            Read the next block, replaying recorded data first.
+
+            @rtype: bytes
+            @return: The data read, empty at the end of the stream
+        """
+        if self._replay:
+            return self._replay.pop(0)
+
+        if self.overflowed:
+            return b""
+
+        data = os.read(self.fd, self.blocksize)
+        if self.recording and data:
+            self._recorded_size += len(data)
+            if self._recorded_size > self.max_recording:
+                # End the stream instead of keeping all of it in memory
+                _log.debug(_("Stopped recording the input after %(size)d "
+                             "bytes") % {
+                    "size": self._recorded_size,
+                })
+                self.overflowed = True
+                self._recorded = []
+                return b""
+            self._recorded.append(data)
+
+        return data
+
+    def _on_need_data(self, appsrc, length):
+        try:
+            data = self.read()
+        except OSError as e:
+            _log.error(_("Unable to read input: %(error)s") % {
+                "error": str(e),
+            })
+            data = b""
+
+        if data:
+            appsrc.emit("push-buffer", Gst.Buffer.new_wrapped(data))
+        else:
+            appsrc.emit("end-of-stream")
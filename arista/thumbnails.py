@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+"""
+    Arista Thumbnails
+    =================
+    Take a number of evenly spaced frames from an input and save them as
+    JPEG or PNG thumbnails or as a single tiled contact sheet.
+
+    Frames can either be grabbed with keyframe seeks, which does not decode
+    the whole input, or from a side branch of a running transcode which
+    reuses the frames that are being encoded anyway.
+
+    Example Use
+    -----------
+
+        >>> import arista.thumbnails
+        >>> arista.thumbnails.extract("file:///tmp/movie.mkv", 9,
+        ...                           sheet="/tmp/movie-sheet.jpg")
+        ['/tmp/movie-sheet.jpg']
+
+    License
+    -------
+    Copyright 2008 - 2011 Daniel G. Taylor <dan@programmer-art.org>
+
+    This file is part of Arista.
+
+    Arista is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as
+    published by the Free Software Foundation, either version 2.1 of
+    the License, or (at your option) any later version.
+
+    Arista is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with Arista.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import math
+import gettext
+import logging
+
+import gi
+
+gi.require_version('Gst', '1.0')
+gi.require_version('GstPbutils', '1.0')
+gi.require_version('GdkPixbuf', '2.0')
+from gi.repository import GdkPixbuf
+from gi.repository import GLib
+from gi.repository import Gst
+from gi.repository import GstPbutils
+
+from . import init as gst_init
+from .sampler import sample_frames, get_frame
+
+_ = gettext.gettext
+_log = logging.getLogger("arista.thumbnails")
+
+# Default thumbnail width, the height follows the display aspect ratio
+THUMBNAIL_WIDTH = 160
+
+# Default number of thumbnails per row of a contact sheet
+SHEET_COLUMNS = 4
+
+THUMBNAIL_CAPS = "video/x-raw,format=RGB,width=%d,pixel-aspect-ratio=1/1"
+
+
+def get_positions(start, end, count):
+    '''
+    Get count evenly spaced positions between start and end, leaving out
+    the very start and end which are often black.
+
+    >>> get_positions(0, 100, 4)
+    [20, 40, 60, 80]
+    >>> get_positions(50, 100, 1)
+    [75]
+    '''
+    return [start + (end - start) * (i + 1) // (count + 1)
+            for i in range(count)]
+
+
+def get_sheet_path(filename):
+    '''
+    Get the default contact sheet name for an input or output file.
+
+    >>> get_sheet_path("/videos/holiday1.mp4")
+    '/videos/holiday1-sheet.jpg'
+    '''
+    return os.path.splitext(filename)[0] + "-sheet.jpg"
+
+
+def _get_pixbuf(frame):
+    data, width, height, stride = frame
+    return GdkPixbuf.Pixbuf.new_from_bytes(GLib.Bytes.new(data),
+                                           GdkPixbuf.Colorspace.RGB, False,
+                                           8, width, height, stride)
+
+
+def _get_type(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return ext == ".png" and "png" or "jpeg"
+
+
+def save_frames(frames, pattern):
+    '''
+    Save RGB frames as separate images.
+
+    @type frames: list
+    @param frames: Frames as (data, width, height, stride) tuples
+    @type pattern: str
+    @param pattern: Filename pattern containing a number format, e.g.
+                    thumb-%03d.jpg; the extension selects JPEG or PNG
+    @rtype: list
+    @return: The written filenames
+    '''
+    written = []
+    for index, frame in enumerate(frames):
+        filename = pattern % (index + 1)
+        _get_pixbuf(frame).savev(filename, _get_type(filename), [], [])
+        written.append(filename)
+
+    return written
+
+
+def save_contact_sheet(frames, filename, columns=SHEET_COLUMNS):
+    '''
+    Save RGB frames tiled into a single contact sheet image.
+
+    @type frames: list
+    @param frames: Frames as (data, width, height, stride) tuples
+    @type filename: str
+    @param filename: The image to write; the extension selects JPEG or PNG
+    @type columns: int
+    @param columns: The number of frames per row
+    @rtype: list
+    @return: The written filenames
+    '''
+    if not frames:
+        return []
+
+    width = max([frame[1] for frame in frames])
+    height = max([frame[2] for frame in frames])
+    columns = min(columns, len(frames))
+    rows = int(math.ceil(len(frames) / float(columns)))
+
+    sheet = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, False, 8,
+                                 width * columns, height * rows)
+    sheet.fill(0x000000ff)
+
+    for index, frame in enumerate(frames):
+        x = (index % columns) * width
+        y = (index // columns) * height
+        _get_pixbuf(frame).copy_area(0, 0, frame[1], frame[2], sheet, x, y)
+
+    sheet.savev(filename, _get_type(filename), [], [])
+
+    return [filename]
+
+
+def save(frames, pattern=None, sheet=None, columns=SHEET_COLUMNS):
+    '''
+    Save frames as separate images and/or as a contact sheet.
+
+    @rtype: list
+    @return: The written filenames
+    '''
+    written = []
+    try:
+        if pattern:
+            written += save_frames(frames, pattern)
+        if sheet:
+            written += save_contact_sheet(frames, sheet, columns)
+    except GLib.GError as e:
+        _log.error(_("Unable to save thumbnails: %(error)s") % {
+            "error": str(e),
+        })
+
+    return written
+
+
+def extract(uri, count, pattern=None, sheet=None, width=THUMBNAIL_WIDTH,
+            columns=SHEET_COLUMNS):
+    '''
+    Take count evenly spaced frames from an input with keyframe seeks and
+    save them. Only the frames at the seek positions are decoded.
+
+    @type uri: str
+    @param uri: The input URI
+    @type count: int
+    @param count: The number of frames to take
+    @type pattern: str
+    @param pattern: Filename pattern for separate images, e.g. thumb-%03d.jpg
+    @type sheet: str
+    @param sheet: Filename for a contact sheet
+    @type width: int
+    @param width: The thumbnail width
+    @type columns: int
+    @param columns: The number of frames per contact sheet row
+    @rtype: list
+    @return: The written filenames
+    '''
+    gst_init()
+
+    discoverer = GstPbutils.Discoverer.new(Gst.SECOND * 5)
+    try:
+        info = discoverer.discover_uri(uri)
+    except GLib.GError as e:
+        _log.error(_("Unable to discover %(uri)s: %(error)s") % {
+            "uri": uri,
+            "error": str(e),
+        })
+        return []
+
+    source = "uridecodebin uri=\"%s\" name=dmux" % uri
+    frames = list(sample_frames(source, info.get_duration(), count,
+                                caps=THUMBNAIL_CAPS % width))
+
+    return save(frames, pattern, sheet, columns)
+
+
+class ThumbnailBranch(object):
+    """
+        Grab thumbnails from a side branch of a running transcode. Frames
+        that are not needed are dropped before any conversion, so only the
+        selected frames cost anything extra.
+    """
+    def __init__(self, count, pattern=None, sheet=None,
+                 width=THUMBNAIL_WIDTH, columns=SHEET_COLUMNS):
+        self.count = count
+        self.pattern = pattern
+        self.sheet = sheet
+        self.width = width
+        self.columns = columns
+
+        self.frames = []
+        self._positions = []
+
+    def get_branch(self, tee):
+        """
+            Get the branch to add to a gst-launch string.
+
+            @type tee: str
+            @param tee: The name of the tee to branch from
+            @rtype: str
+            @return: The branch usable with Gst.parse_launch
+        """
+        # Frames before the first position are dropped, so the sink must
+        # not wait for one to preroll or the pipeline never pauses
+        return " %s. ! queue name=thumbqueue ! videoconvert ! videoscale ! " \
+               "%s ! appsink name=thumbsink sync=false async=false " \
+               "emit-signals=true" % (tee, THUMBNAIL_CAPS % self.width)
+
+    def attach(self, pipe, start, end):
+        """
+            Start grabbing frames from a pipeline built with get_branch.
+
+            @type pipe: Gst.Pipeline
+            @param pipe: The pipeline
+            @type start: int
+            @param start: The position of the first frame in nanoseconds
+            @type end: int
+            @param end: The position of the last frame in nanoseconds
+        """
+        self.frames = []
+        self._positions = get_positions(start, end, self.count)
+
+        pad = pipe.get_by_name("thumbqueue").get_static_pad("sink")
+        pad.add_probe(Gst.PadProbeType.BUFFER, self._on_probe)
+        pipe.get_by_name("thumbsink").connect("new-sample",
+                                              self._on_new_sample)
+
+    def _on_probe(self, pad, info):
+        buf = info.get_buffer()
+        if self._positions and buf.pts != Gst.CLOCK_TIME_NONE and \
+           buf.pts >= self._positions[0]:
+            self._positions.pop(0)
+            return Gst.PadProbeReturn.OK
+
+        return Gst.PadProbeReturn.DROP
+
+    def _on_new_sample(self, appsink):
+        frame = get_frame(appsink.emit("pull-sample"))
+        if frame:
+            self.frames.append(frame)
+        return Gst.FlowReturn.OK
+
+    def save(self):
+        """
+            Save the grabbed frames.
+
+            @rtype: list
+            @return: The written filenames
+        """
+        return save(self.frames, self.pattern, self.sheet, self.columns)
@@ -27,21 +27,19 @@
 """
 
 import os
+import copy
 import os.path
 import time
+import shutil
+import tempfile
+import threading
 import gettext
 import logging
 
-# Default to 2 CPUs as most seem to be dual-core these days
-CPU_COUNT = 2
 try:
-    import multiprocessing
-    try:
-        CPU_COUNT = multiprocessing.cpu_count()
-    except NotImplementedError:
-        pass
+    import numpy
 except ImportError:
-    pass
+    numpy = None
 
 import gi
 
@@ -53,14 +51,107 @@ from gi.repository import Gst
 from gi.repository import GstPbutils
 
 from . import discoverer
+from . import interlace
+from . import init as gst_init
+from .autocrop import detect_crop
 from .discoverer import is_audio, is_video, get_range_value, \
-    get_video_dimension, get_list_value
-from .presets import remove_param_from_passes
-from .utils import expand_capacity
+    get_video_dimension, get_list_value, get_caps_formats, get_stream_format, \
+    get_factory_formats, get_fraction_list_value
+from .interlace import detect_interlacing
+from .output import AtomicOutput, get_bitrate, estimate_size, is_faststart
+from .readahead import ReadAhead, READAHEAD_BLOCKSIZE
+from .presets import FASTSTART_RESERVE, PresetError, remove_param_from_passes, \
+    parse_pass, make_pass_from_dict, DEINTERLACER, get_missing_elements
+from .streams import is_stream, get_fd, get_streamable_muxer, StreamReader, \
+    is_network, is_rtp, get_network_muxer, get_network_sink, get_rtp_sink
+from .thumbnails import ThumbnailBranch, get_sheet_path
+from .utils import expand_capacity, nearest_in_capacity, Fraction, \
+                   get_friendly_size
 
 _ = gettext.gettext
 _log = logging.getLogger("arista.transcoder")
 
+# Deinterlacing modes for TranscoderOptions.deinterlace
+DEINTERLACE_AUTO = "auto"
+DEINTERLACE_FORCE = "force"
+DEINTERLACE_OFF = "off"
+
+# Muxers which need a constant framerate, so frames can't be decimated
+CFR_CONTAINERS = ("avimux", "avmux_dvd", "ffmux_dvd", "avmux_vob",
+                  "mpegpsmux")
+
+# Frames are compared on their luma plane, downscaled by averaging blocks
+# of this many pixels square, which evens out noise
+DECIMATE_BLOCK = 8
+
+# Where the luma of 8 bit YUV formats is, as (byte offset in a row, bytes
+# per pixel) in the first plane
+LUMA_LAYOUTS = {
+    "I420": (0, 1),
+    "YV12": (0, 1),
+    "NV12": (0, 1),
+    "NV21": (0, 1),
+    "NV16": (0, 1),
+    "NV24": (0, 1),
+    "Y41B": (0, 1),
+    "Y42B": (0, 1),
+    "Y444": (0, 1),
+    "A420": (0, 1),
+    "GRAY8": (0, 1),
+    "YUY2": (0, 2),
+    "YVYU": (0, 2),
+    "UYVY": (1, 2),
+    "VYUY": (1, 2),
+    "AYUV": (1, 4),
+}
+
+# Always keep at least one frame per this time when decimating
+DECIMATE_MAX_GAP = Gst.SECOND
+
+# Inputs that are live by default: capture devices and the test sources
+# of testsrcbin, e.g. testbin://video,is-live=true,pattern=ball
+LIVE_URI_PREFIXES = ("v4l://", "v4l2://", "testbin://")
+
+# Queue used in live mode, dropping old data instead of adding latency
+LIVE_QUEUE = "queue leaky=downstream max-size-buffers=0 max-size-bytes=0 " \
+             "max-size-time=%d" % (Gst.SECOND // 2)
+
+# Properties naming the stats file of multi-pass encoders. libav encoders
+# (avenc_*) all use multipass-cache-file.
+STATS_FILE_PROPERTIES = {
+    "x264enc": "multipass-cache-file",
+    "theoraenc": "multipass-cache-file",
+    "vp8enc": "multipass-cache-file",
+    "vp9enc": "multipass-cache-file",
+    "xvidenc": "statsfile",
+}
+
+# Encoders that fail to negotiate with the output of filters such as
+# videobox unless a colorspace conversion is kept in front of them
+RESTRICTED_FORMAT_ENCODERS = ("xvidenc",)
+
+# Muxers which can write their index at the start of the file
+FASTSTART_MUXERS = ("mp4mux", "qtmux")
+
+# Index space is reserved for this much more than the input duration, plus
+# FASTSTART_EXTRA_DURATION
+FASTSTART_MARGIN = 1.1
+FASTSTART_EXTRA_DURATION = 10 * Gst.SECOND
+
+# How often the reserved index is updated, so crashed encodes are playable
+FASTSTART_UPDATE_PERIOD = 10 * Gst.SECOND
+
+# Fragment duration in milliseconds for fragmented MP4 output
+FASTSTART_FRAGMENT_DURATION = 1000
+
+# Encoder settings that minimize latency in live mode
+LIVE_ENCODER_SETTINGS = {
+    "x264enc": {"tune": "zerolatency"},
+    "vp8enc": {"deadline": "1", "lag-in-frames": "0"},
+    "vp9enc": {"deadline": "1", "lag-in-frames": "0"},
+    "theoraenc": {"speed-level": "2"},
+}
+
 
 # =============================================================================
 # Custom exceptions
@@ -90,6 +181,79 @@ class PipelineException(TranscoderException):
 # Transcoder Options
 # =============================================================================
 
+def needs_conversion(src_format, enc_formats, encoder=""):
+    '''
+    Check whether raw data needs a format conversion before it goes into
+    an encoder. Data whose format is only known once the pipeline
+    negotiates always gets one, as does data for encoders known to fail
+    without one.
+
+    >>> needs_conversion("I420", set(["I420", "NV12"]))
+    False
+    >>> needs_conversion("I420", None)
+    False
+    >>> needs_conversion("AYUV", set(["I420", "NV12"]))
+    True
+    >>> needs_conversion(None, set(["I420"]))
+    True
+    >>> needs_conversion("I420", set(["I420"]), "xvidenc")
+    True
+
+    @type src_format: str
+    @param src_format: The raw source format, e.g. I420, or None if unknown
+    @type enc_formats: set
+    @param enc_formats: The formats the encoder accepts, None for any
+    @type encoder: str
+    @param encoder: The encoder element name, e.g. x264enc
+    @rtype: bool
+    @return: True if the conversion has to stay in the pipeline
+    '''
+    if not src_format or encoder in RESTRICTED_FORMAT_ENCODERS:
+        return True
+
+    return enc_formats is not None and src_format not in enc_formats
+
+
+def get_luma_blocks(data, width, height, stride, offset=0, step=1,
+                    block=DECIMATE_BLOCK):
+    '''
+    Get the luma plane of a frame downscaled by averaging blocks of pixels.
+
+    >>> row = bytes([16] * 4 + [235] * 4)
+    >>> get_luma_blocks(row * 8, 8, 8, 8, block=4).tolist()
+    [[16.0, 235.0], [16.0, 235.0]]
+    >>> packed = bytes([128, 16] * 4) + bytes(8)
+    >>> get_luma_blocks(packed * 4, 4, 4, 16, 1, 2, block=2).tolist()
+    [[16.0, 16.0], [16.0, 16.0]]
+
+    @type data: bytes
+    @param data: The frame data, starting with the plane holding the luma
+    @type width: int
+    @param width: The frame width
+    @type height: int
+    @param height: The frame height
+    @type stride: int
+    @param stride: The bytes per row of the luma plane
+    @type offset: int
+    @param offset: The offset of the luma of the first pixel in a row
+    @type step: int
+    @param step: The bytes per pixel in a row
+    @type block: int
+    @param block: The size of the blocks to average
+    @rtype: numpy.ndarray
+    @return: The block means as a height / block x width / block array
+    '''
+    rows = numpy.frombuffer(data, numpy.uint8, count=stride * height) \
+                .reshape(height, stride)
+    luma = rows[:, offset:offset + width * step:step]
+
+    # Leave out pixels at the edges that don't fill a whole block
+    block = max(min(block, width, height), 1)
+    h, w = height - height % block, width - width % block
+    return luma[:h, :w].reshape(h // block, block, w // block, block) \
+               .mean(axis=(1, 3))
+
+
 class TranscoderOptions(object):
     """
         Options pertaining to the input/output location, presets,
@@ -97,8 +261,12 @@ class TranscoderOptions(object):
     """
     def __init__(self, uri = None, preset = None, output_uri = None, ssa = False,
                  subfile = None, subfile_charset = None, font = "Sans Bold 16",
-                 deinterlace = None, crop = None, title = None, chapter = None,
-                 audio = None):
+                 deinterlace = DEINTERLACE_AUTO, crop = None, title = None, chapter = None,
+                 audio = None, autocrop = False, decimate = None,
+                 live = None, start = None, end = None, thumbnails = 0,
+                 thumbnail_pattern = None, thumbnail_sheet = None,
+                 buffer_size = None, buffer_mode = None, readahead = None,
+                 drop_behind = False, scratch_dir = None):
         """
             @type uri: str
             @param uri: The URI to the input file, device, or stream
@@ -113,8 +281,11 @@ class TranscoderOptions(object):
                                     'utf-8' or 'latin-1'
             @type font: str
             @param font: Pango font description
-            @type deinterlace: bool
-            @param deinterlace: Force deinterlacing of the input data
+            @type deinterlace: str
+            @param deinterlace: Deinterlacing mode, one of DEINTERLACE_AUTO,
+                                DEINTERLACE_FORCE or DEINTERLACE_OFF. For
+                                backwards compatibility True forces and
+                                False disables deinterlacing.
             @type crop: int tuple
             @param crop: How much should be cropped on each side
                                     (top, right, bottom, left)
@@ -124,14 +295,63 @@ class TranscoderOptions(object):
             @param chapter: DVD chapter index
             @type audio: int
             @param audio: DVD audio stream index
+            @type autocrop: bool
+            @param autocrop: Detect black bars and crop them when no crop
+                             has been given
+            @type decimate: float
+            @param decimate: Drop frames whose mean luma difference to the
+                             last kept frame, compared in 8x8 pixel block
+                             averages, is below this threshold (0 - 255),
+                             useful for screencasts; None disables it
+            @type live: bool
+            @param live: Use low latency live mode, by default only for
+                         v4l:// and v4l2:// capture inputs and
+                         testbin:// test sources
+            @type start: float
+            @param start: Position in seconds to start encoding at
+            @type end: float
+            @param end: Position in seconds to stop encoding at
+            @type thumbnails: int
+            @param thumbnails: Number of evenly spaced thumbnails to grab
+                               while encoding
+            @type thumbnail_pattern: str
+            @param thumbnail_pattern: Filename pattern to save thumbnails to,
+                                      e.g. thumb-%03d.jpg
+            @type thumbnail_sheet: str
+            @param thumbnail_sheet: Filename to save a contact sheet to; by
+                                    default it is named after the output
+                                    file if no thumbnail_pattern is given
+            @type buffer_size: int
+            @param buffer_size: Size of the output file write buffer in
+                                bytes, None for the filesink default
+            @type buffer_mode: str
+            @param buffer_mode: Output file buffering, one of
+                                arista.output.BUFFER_MODES
+            @type readahead: int
+            @param readahead: Read the input in large blocks and this many
+                              bytes ahead, None to read it the default way
+            @type drop_behind: bool
+            @param drop_behind: With read-ahead, drop input data that has
+                                been read from the page cache
+            @type scratch_dir: str
+            @param scratch_dir: Where to create the private directory for
+                                multi-pass stats files, e.g. a tmpfs like
+                                /dev/shm; None for the system temp directory
         """
         self.reset(uri, preset, output_uri, ssa,subfile, subfile_charset, font,
-                   deinterlace, crop, title, chapter, audio)
+                   deinterlace, crop, title, chapter, audio, autocrop,
+                   decimate, live, start, end, thumbnails, thumbnail_pattern,
+                   thumbnail_sheet, buffer_size, buffer_mode, readahead,
+                   drop_behind, scratch_dir)
 
     def reset(self, uri = None, preset = None, output_uri = None, ssa = False,
               subfile = None, subfile_charset = None, font = "Sans Bold 16",
-              deinterlace = None, crop = None, title = None, chapter = None,
-              audio = None):
+              deinterlace = DEINTERLACE_AUTO, crop = None, title = None, chapter = None,
+              audio = None, autocrop = False, decimate = None,
+              live = None, start = None, end = None, thumbnails = 0,
+              thumbnail_pattern = None, thumbnail_sheet = None,
+              buffer_size = None, buffer_mode = None, readahead = None,
+              drop_behind = False, scratch_dir = None):
         """
             Reset the input options to nothing.
         """
@@ -147,6 +367,28 @@ class TranscoderOptions(object):
         self.title = title
         self.chapter = chapter
         self.audio = audio
+        self.autocrop = autocrop
+        self.decimate = decimate
+        self.live = live
+        self.start = start
+        self.end = end
+        self.thumbnails = thumbnails
+        self.thumbnail_pattern = thumbnail_pattern
+        self.thumbnail_sheet = thumbnail_sheet
+        self.buffer_size = buffer_size
+        self.buffer_mode = buffer_mode
+        self.readahead = readahead
+        self.drop_behind = drop_behind
+        self.scratch_dir = scratch_dir
+
+    @property
+    def force_deinterlace(self):
+        """
+            Whether the input is always deinterlaced, so the deinterlacer
+            must be installed before the job starts.
+        """
+        return self.deinterlace is True or \
+               self.deinterlace == DEINTERLACE_FORCE
 
 # =============================================================================
 # The Transcoder
@@ -177,15 +419,90 @@ class Transcoder(GObject.GObject):
                             output uri, etc.
         """
         super().__init__()
+        gst_init()
         self.options = options
 
         self.pipe = None
 
         self.enc_pass = 0
 
+        # Conversion stages left out of the current pass as (stage, reason)
+        self.elided = []
+
+        # Conversion stages kept although they may be no-ops, as (stage,
+        # reason)
+        self.kept = []
+
+        # Crop found by black bar detection as (top, right, bottom, left),
+        # all zero if no black bars were found and None if detection has
+        # not run
+        self.detected_crop = None
+
+        # Whether the input is being analyzed before the first pass
+        self._analyzing = False
+
+        # Whether the deinterlacer is used, decided before the first pass
+        # and None until then
+        self.deinterlacing = None
+
+        # Live capture inputs get leaky queues and low latency encoding
+        self.live = options.live
+        if self.live is None:
+            self.live = options.uri.startswith(LIVE_URI_PREFIXES)
+
+        # Encoded frames and the latest capture to encoder output latency
+        # in nanoseconds, measured in live mode
+        self.frames = 0
+        self.latency = 0
+        self.max_latency = 0
+
+        # Grabs thumbnails during the last pass, and the files written
+        self.thumbnail_branch = None
+        self.thumbnails = []
+
+        # Reads stdin or file descriptor inputs, None for other inputs
+        self.stream_reader = None
+
+        # Gives read-ahead hints for the input if enabled
+        self.read_ahead = None
+        if options.readahead:
+            self.read_ahead = ReadAhead(options.readahead,
+                                        options.drop_behind)
+
+        # Bytes read from the input during the current pass
+        self.bytes_read = 0
+
+        # Temporary file output, moved into place once complete. None for
+        # stream and network outputs.
+        self.output = None
+
+        # Private directory for multi-pass stats files, so parallel jobs
+        # don't overwrite each other's. Created by the first pass.
+        self.scratch_dir = None
+
+        # Set by cancel() so the partial output is thrown away
+        self.cancelled = False
+
+        # Whether the finished output was verified to have its index at the
+        # start, None if the preset doesn't ask for fast start
+        self.faststart = None
+        self._faststart_muxer = False
+
+        # Total bitrate of the current pass in bits per second, if known
+        self._bitrate = 0
+
+        # Frames dropped as near duplicates during the current pass
+        self.dropped_frames = 0
+        self._decimate_last = None
+        self._decimate_last_pts = 0
+        self._decimate_warned = False
+
         self._percent_cached = 0
         self._percent_cached_time = 0
 
+        # Set when a new pass needs to seek to the selected range
+        self._pending_seek = False
+
         if options.uri.startswith("dvd://") and len(options.uri.split("@")) < 2:
             options.uri += "@%(title)s:%(chapter)s:%(audio)s" % {
                 "title": options.title or "a",
@@ -229,13 +546,7 @@ class Transcoder(GObject.GObject):
                     self.emit("discovered", self.info, is_video(self.info) or is_audio(self.info))
 
                     if is_video(self.info) or is_audio(self.info):
-                        try:
-                            self._setup_pass()
-                        except PipelineException as e:
-                            self.emit("error", str(e))
-                            return
-
-                        self.start()
+                        self._analyze()
                         return
 
                 self.options.uri = fname + "@" + str(title + 1) + ":a:a"
@@ -251,8 +562,25 @@ class Transcoder(GObject.GObject):
             self.info = None
             self.discoverer = discoverer.Discoverer.new(Gst.SECOND*5)
             self.discoverer.connect("discovered", self.on_got_info)
+
+            uri = options.uri
+            if is_stream(uri):
+                # Pipes can only be read once, so discover from what the
+                # reader records and replay that to the pipeline later
+                try:
+                    fd = get_fd(uri, 0)
+                except ValueError as e:
+                    # Let the caller connect to the signal first
+                    GLib.idle_add(self.emit, "error", str(e))
+                    return
+                self.stream_reader = StreamReader(fd,
+                    self.read_ahead and READAHEAD_BLOCKSIZE or 65536)
+                self.discoverer.connect("source-setup",
+                    lambda disco, source: self.stream_reader.attach(source))
+                uri = "appsrc://"
+
             self.discoverer.start()
-            self.discoverer.discover_uri_async(options.uri)
+            self.discoverer.discover_uri_async(uri)
 
     @property
     def infile(self):
@@ -301,19 +629,148 @@ class Transcoder(GObject.GObject):
                 except (TypeError, ValueError, IndexError):
                     chapter = None
 
-            if self.options.deinterlace is None:
-                self.options.deinterlace = True
-
             return "dvdreadsrc device=\"%s\" title=%d %s ! decodebin2 name=dmux" % (device, title, chapter and "chapter=" + str(chapter) or '')
-        elif self.infile.startswith("v4l://") or self.infile.startswith("v4l2://"):
+        elif is_stream(self.infile):
+            return "appsrc name=streamsrc ! decodebin name=dmux"
+        elif self.infile.startswith(LIVE_URI_PREFIXES):
             filename = self.infile
-        elif self.infile.startswith("file://"):
+        elif self.infile.startswith("file://") or \
+             self.infile.startswith("http://") or \
+             self.infile.startswith("https://"):
             filename = self.infile
         else:
             filename = "file://" + os.path.abspath(self.infile)
 
         return "uridecodebin uri=\"%s\" name=dmux" % filename
 
+    def _get_sink(self):
+        """
+            Return a file or file descriptor sink string usable with
+            Gst.parse_launch.
+
+            This method uses self.options.output_uri to generate its output.
+
+            @rtype: string
+            @return: Sink to append to Gst-launch style strings.
+        """
+        if is_stream(self.options.output_uri):
+            try:
+                return "fdsink name=sink fd=%d" % \
+                       get_fd(self.options.output_uri, 1)
+            except ValueError as e:
+                raise PipelineException(str(e))
+        elif is_network(self.options.output_uri):
+            try:
+                return get_network_sink(self.options.output_uri)
+            except ValueError as e:
+                raise PipelineException(str(e))
+
+        if not self.output:
+            self.output = AtomicOutput(self.options.output_uri)
+
+        sink = "filesink name=sink location=\"%s\"" % self.output.path
+        if self.options.buffer_mode:
+            sink += " buffer-mode=%s" % self.options.buffer_mode
+        if self.options.buffer_size:
+            sink += " buffer-size=%d" % self.options.buffer_size
+
+        return sink
+
+    def _get_faststart_muxer(self, container):
+        """
+            Configure an MP4/QuickTime muxer to write its index at the start
+            of the file while muxing, instead of rewriting the whole file
+            afterwards like faststart=1 does.
+
+            @type container: str
+            @param container: The container element and its properties
+            @rtype: str
+            @return: The muxer to use
+        """
+        name, sep, props = container.partition(" ")
+        if name not in FASTSTART_MUXERS:
+            return container
+
+        settings = parse_pass(props)
+        settings.pop("faststart", None)
+        self._faststart_muxer = True
+
+        start, end = self.get_range()
+        duration = end - start
+        if self.preset.faststart == FASTSTART_RESERVE and \
+           end != Gst.CLOCK_TIME_NONE and duration > 0:
+            settings["reserved-max-duration"] = \
+                int(duration * FASTSTART_MARGIN) + FASTSTART_EXTRA_DURATION
+            settings["reserved-moov-update-period"] = FASTSTART_UPDATE_PERIOD
+        else:
+            if self.preset.faststart == FASTSTART_RESERVE:
+                _log.debug(_("Unknown duration, writing fragmented output"))
+            settings["fragment-duration"] = FASTSTART_FRAGMENT_DURATION
+
+        return "%s %s" % (name, make_pass_from_dict(settings))
+
+    def _use_scratch_dir(self, encoder, properties):
+        """
+            Point the stats file of a multi-pass encoder into the private
+            scratch directory of this job.
+
+            @type encoder: str
+            @param encoder: The encoder element name, e.g. x264enc
+            @type properties: dict
+            @param properties: The encoder properties of the pass, which are
+                               updated with the stats file
+        """
+        prop = STATS_FILE_PROPERTIES.get(encoder)
+        if not prop and encoder.startswith("avenc_"):
+            prop = "multipass-cache-file"
+        if not prop:
+            return
+
+        if not self.scratch_dir:
+            try:
+                self.scratch_dir = tempfile.mkdtemp(prefix="arista-",
+                                                    dir=self.options.scratch_dir)
+            except OSError as e:
+                raise PipelineException(_("Unable to create scratch "
+                                          "directory: %(error)s") % {
+                    "error": str(e),
+                })
+
+        name = os.path.basename(properties.get(prop) or "") or \
+               encoder + ".stats"
+        properties[prop] = os.path.join(self.scratch_dir, name)
+
+    def _get_passes(self, codec):
+        """
+            Get the compiled passes of a codec.
+
+            @type codec: Codec
+            @param codec: The audio or video codec of the preset
+            @rtype: list
+            @return: An EncoderPass for each pass
+        """
+        try:
+            return codec.compile()
+        except PresetError as e:
+            raise PipelineException(str(e))
+
+    def _get_rtp_sink(self, encoder, stream):
+        """
+            Return a payloader and sink string to send one encoded stream
+            to self.options.output_uri as RTP.
+
+            @type encoder: str
+            @param encoder: The encoder element name, e.g. x264enc
+            @type stream: int
+            @param stream: The stream index, 0 for video and 1 for audio
+            @rtype: string
+            @return: Elements to append to Gst-launch style strings.
+        """
+        try:
+            return get_rtp_sink(encoder, self.options.output_uri, stream)
+        except ValueError as e:
+            raise PipelineException(str(e))
+
     def _setup_pass(self):
         """
             Setup the pipeline for an encoding pass. This configures the
@@ -324,6 +781,14 @@ class Transcoder(GObject.GObject):
 
         self.acaps = Gst.Caps.new_empty_simple('audio/x-raw')
 
+        self.elided = []
+        self.kept = []
+        self._bitrate = 0
+
+        # Encoder element names and the pass with the properties to set on
+        # them once the pipeline is built
+        self._encoder_settings = []
+
         # =====================================================================
         # Setup video, audio/video, or audio transcode pipeline
         # =====================================================================
@@ -341,9 +806,22 @@ class Transcoder(GObject.GObject):
                         self.preset.acodec.container or \
                         self.preset.container
 
+        # RTP sends each stream on its own, so there is nothing to mux
+        rtp = is_rtp(self.options.output_uri)
+        if rtp:
+            container = None
+
         mux_str = ""
         if container:
-            mux_str = "%s name=mux ! queue !" % container
+            muxer = container
+            if is_stream(self.options.output_uri):
+                muxer = get_streamable_muxer(container)
+            elif is_network(self.options.output_uri):
+                muxer = get_network_muxer(container)
+                container = muxer.split()[0]
+            elif self.preset.faststart:
+                muxer = self._get_faststart_muxer(container)
+            mux_str = "%s name=mux ! %s !" % (muxer, self._queue())
 
         # Decide whether or not we are using a muxer and link to it or just
         # the file sink if we aren't (for e.g. mp3 audio)
@@ -354,8 +832,10 @@ class Transcoder(GObject.GObject):
 
         src = self._get_source()
 
-        cmd = "%s %s filesink name=sink " \
-              "location=\"%s\"" % (src, mux_str, self.options.output_uri)
+        if rtp:
+            cmd = src
+        else:
+            cmd = "%s %s %s" % (src, mux_str, self._get_sink())
 
         if is_video(self.info) and self.preset.vcodec:
             # =================================================================
@@ -364,9 +844,10 @@ class Transcoder(GObject.GObject):
             element = Gst.ElementFactory.make(self.preset.vcodec.name,
                                               "videoencoder")
 
-            # TODO: Add rate limits based on encoder sink below
             cap = element.get_static_pad("sink").query_caps()
             struct = cap.get_structure(0)
+            capable_framerates = struct.has_field('framerate') and \
+                                 get_fraction_list_value(struct, 'framerate')
             for field in ('width', 'height'):
                 if struct.has_field(field):
                     range_data = get_range_value(struct, field)
@@ -405,6 +886,12 @@ class Transcoder(GObject.GObject):
                 # The videocaps we are looking for may not even exist, just ignore
                 v_stream = None
 
+            # The raw format the source has once decoded, if it is known
+            # before the pipeline negotiates
+            src_format = v_stream and get_stream_format(v_stream)
+            enc_formats = get_caps_formats(cap)
+            vencoder_name = self.preset.vcodec.name
+
             width, height = owidth, oheight
 
             # Scale width / height to fit requested min/max
@@ -422,25 +909,39 @@ class Transcoder(GObject.GObject):
                 height = hmax
                 width = int((float(hmax) / oheight) * owidth)
 
-            # Add any required padding
-            # TODO: Remove the extra colorspace conversion when no longer
-            #       needed, but currently xvidenc and possibly others will fail
-            #       without it!
+            # Add any required padding. The colorspace conversion after the
+            # videobox is only left out when the source format passes
+            # through the videobox and the encoder accepts it; some
+            # encoders (e.g. xvidenc) fail without it.
             vbox = ""
             if width < wmin and height < hmin:
                 wpx = (wmin - width) / 2
                 hpx = (hmin - height) / 2
-                vbox = "videobox left=%i right=%i top=%i bottom=%i ! videoconvert ! " % \
+                vbox = "videobox left=%i right=%i top=%i bottom=%i ! " % \
                        (-wpx, -wpx, -hpx, -hpx)
             elif width < wmin:
                 px = (wmin - width) / 2
-                vbox = "videobox left=%i right=%i ! videoconvert ! " % \
+                vbox = "videobox left=%i right=%i ! " % \
                        (-px, -px)
             elif height < hmin:
                 px = (hmin - height) / 2
-                vbox = "videobox top=%i bottom=%i ! videoconvert ! " % \
+                vbox = "videobox top=%i bottom=%i ! " % \
                        (-px, -px)
 
+            if vbox:
+                box_formats = get_factory_formats("videobox",
+                                                  Gst.PadDirection.SINK)
+                if not needs_conversion(src_format, enc_formats,
+                                        vencoder_name) and \
+                   (box_formats is None or src_format in box_formats):
+                    self._elide("videoconvert (padding)",
+                                _("source format %(format)s passes through "
+                                  "videobox to encoder") % {
+                                    "format": src_format,
+                                })
+                else:
+                    vbox += "videoconvert ! "
+
             # FIXME Odd widths / heights seem to freeze Gstreamer
             if width % 2:
                 width += 1
@@ -450,20 +951,63 @@ class Transcoder(GObject.GObject):
             self.vcaps.set_value('width', width)
             self.vcaps.set_value('height', height)
 
-            # TODO: Set framerate and pixel-aspect-ratio
-            # when gir-gstreamer supports
+            # Output pixels are square as the width was corrected for the
+            # source pixel aspect ratio above
+            self.vcaps.set_value('pixel-aspect-ratio', Gst.Fraction(1, 1))
+
+            # Clamp the framerate to what the preset and encoder allow, so
+            # e.g. a 60 fps source is only encoded at 30 fps for a device
+            # that can't play more anyway
+            if v_stream and v_stream.get_framerate_num():
+                src_rate = Fraction(v_stream.get_framerate_num(),
+                                    v_stream.get_framerate_denom())
+                rmin, rmax = min(self.preset.vcodec.rate), \
+                             max(self.preset.vcodec.rate)
+                if capable_framerates:
+                    rate = nearest_in_capacity(src_rate, capable_framerates,
+                                               rmin, rmax)
+                elif rmax:
+                    rate = min(max(src_rate, rmin), rmax)
+                else:
+                    rate = src_rate
+                rate = Fraction(rate)
+                self.vcaps.set_value('framerate',
+                                     Gst.Fraction(rate.num, rate.denom))
 
             # =================================================================
             # Setup the video encoder and options
             # =================================================================
-            vencoder = "%s %s" % (self.preset.vcodec.name,
-                                  self.preset.vcodec.passes[self.enc_pass] % {
-                                    "threads": CPU_COUNT,
-                                  })
+            vpass = self._get_passes(self.preset.vcodec)[self.enc_pass]
+            vprops = vpass.properties.copy()
+            if self.live and self.preset.vcodec.name in LIVE_ENCODER_SETTINGS:
+                # Settings from the preset win over the live defaults
+                for key, value in LIVE_ENCODER_SETTINGS[
+                                  self.preset.vcodec.name].items():
+                    vprops.setdefault(key, value)
+
+            if self.preset.pass_count > 1:
+                self._use_scratch_dir(self.preset.vcodec.name, vprops)
+
+            vencoder = "%s name=videoencoder" % self.preset.vcodec.name
+            if vpass.caps:
+                vencoder += " ! " + vpass.caps
+            self._encoder_settings.append(("videoencoder", vpass, vprops))
+            self._bitrate += get_bitrate(self.preset.vcodec.name, vprops) or 0
+
+            if self.deinterlacing and \
+               DEINTERLACER in get_missing_elements([DEINTERLACER]):
+                if self.options.force_deinterlace:
+                    raise PipelineException(_("Missing element %(element)s "
+                                              "needed to deinterlace") % {
+                        "element": DEINTERLACER,
+                    })
+                _log.warning(_("%(element)s is not installed, not "
+                               "deinterlacing") % {"element": DEINTERLACER})
+                self.deinterlacing = False
 
             deint = ""
-            if self.options.deinterlace:
-                deint = " avdeinterlace ! "
+            if self.deinterlacing:
+                deint = " %s ! " % DEINTERLACER
 
             transform = ""
             if self.preset.vcodec.transform:
@@ -485,26 +1029,117 @@ class Transcoder(GObject.GObject):
                     "subfile": self.options.subfile,
                     "subfile_charset": charset,
                 }
-
-            if self.options.ssa is True:
-                # Render subtitles onto the video stream
-                sub = "textoverlay font-desc=\"%(font)s\" name=txt ! " % {
-                    "font": self.options.font,
-                }
-                cmd += " filesrc location=\"%(infile)s\" ! matroskademux name=demux ! ssaparse ! txt. " % {
-                    "infile": self.infile,
-                }
+            elif self.options.ssa is True:
+                if self.info.get_subtitle_streams():
+                    # Render embedded subtitles onto the video stream. The
+                    # decoder already parses them, so link its text pad
+                    # instead of reading and demuxing the input again.
+                    # Frames without active subtitles pass through.
+                    sub = "textoverlay font-desc=\"%(font)s\" name=txt ! " % {
+                        "font": self.options.font,
+                    }
+                    cmd += " dmux. ! %s ! txt.text_sink " % self._queue()
+                else:
+                    _log.warning(_("No embedded subtitles found in %(infile)s") % {
+                        "infile": self.infile,
+                    })
 
             vmux = premux
             if container in ("qtmux", "webmmux", "avmux_dvd", "matroskamux", "mp4mux"):
                 if premux.startswith("mux"):
                     vmux += "video_%u"
+            if rtp:
+                vmux = self._get_rtp_sink(self.preset.vcodec.name, 0)
+
+            # Drop near-duplicate frames and let the muxer write variable
+            # framerate output, if it can
+            decimate = ""
+            if self.options.decimate:
+                if numpy is None:
+                    _log.warning(_("NumPy is not available, not dropping "
+                                   "duplicate frames"))
+                elif not container or container.split()[0] in CFR_CONTAINERS:
+                    _log.warning(_("Output needs a constant framerate, not "
+                                   "dropping duplicate frames"))
+                else:
+                    decimate = "identity name=decimate ! "
+
+            # Grab thumbnails from the frames that are being encoded anyway
+            thumbs = ""
+            self.thumbnail_branch = None
+            if self.options.thumbnails and \
+               self.enc_pass == self.preset.pass_count - 1:
+                # The default sheet is named after the output as claimed,
+                # which may differ from the name it was queued with
+                sheet = self.options.thumbnail_sheet
+                if not sheet and not self.options.thumbnail_pattern and \
+                   self.output:
+                    sheet = get_sheet_path(self.options.output_uri)
+                self.thumbnail_branch = ThumbnailBranch(
+                                            self.options.thumbnails,
+                                            self.options.thumbnail_pattern,
+                                            sheet)
+                thumbs = "tee name=rawtee ! queue ! "
 
-            cmd += " dmux. ! queue ! videoconvert ! videorate !" \
-                   "%s %s %s %s videoscale ! %s ! %s%s ! tee " \
-                   "name=videotee ! queue ! %s" % \
-                   (deint, vcrop, transform, sub, self.vcaps.to_string(), vbox,
-                    vencoder, vmux)
+            # =================================================================
+            # Leave out conversion stages that would be no-ops
+            # =================================================================
+            vconvert = "videoconvert ! "
+            # Filters in between may need a different format, so only skip
+            # the conversion when raw data goes straight to the encoder
+            filters = deint or vcrop or transform or sub or vbox
+            if not filters and \
+               not needs_conversion(src_format, enc_formats, vencoder_name):
+                vconvert = ""
+                self._elide("videoconvert",
+                            _("source format %(format)s accepted by "
+                              "encoder") % {"format": src_format})
+            elif v_stream and not src_format:
+                self._keep("videoconvert")
+
+            vrate = "videorate ! "
+            if self.live:
+                # Capture timestamps are fine as they are and videorate
+                # would hold frames back to fill gaps
+                vrate = ""
+                self._elide("videorate", _("live input"))
+            elif v_stream and self.vcaps.get_structure(0).has_field("framerate"):
+                src_rate = (v_stream.get_framerate_num(),
+                            v_stream.get_framerate_denom())
+                ok, num, denom = self.vcaps.get_structure(0) \
+                                           .get_fraction("framerate")
+                if ok and src_rate[0] and \
+                   src_rate[0] * denom == num * src_rate[1]:
+                    vrate = ""
+                    self._elide("videorate",
+                                _("source framerate %(num)d/%(denom)d "
+                                  "unchanged") % {
+                                    "num": src_rate[0],
+                                    "denom": src_rate[1],
+                                })
+
+            vscale = "videoscale ! "
+            src_w, src_h = video_w - crop[1] - crop[3], \
+                           video_h - crop[0] - crop[2]
+            square = not v_stream or \
+                     v_stream.get_par_num() == v_stream.get_par_denom()
+            if square and (width, height) == (src_w, src_h):
+                vscale = ""
+                self._elide("videoscale",
+                            _("source size %(width)dx%(height)d "
+                              "unchanged") % {
+                                "width": width,
+                                "height": height,
+                            })
+
+            cmd += " dmux. ! %s ! %s%s%s %s %s %s %s%s ! %s%s ! tee " \
+                   "name=videotee ! %s ! %s" % \
+                   (self._queue(leaky=True), vconvert, vrate, deint, vcrop, transform,
+                    sub, vscale, self.vcaps.to_string(),
+                    vbox + decimate + thumbs, vencoder, self._queue(), vmux)
+
+            if self.thumbnail_branch:
+                cmd += self.thumbnail_branch.get_branch("rawtee")
 
         if is_audio(self.info) and self.preset.acodec and \
            self.enc_pass == len(self.preset.vcodec.passes) - 1:
@@ -515,12 +1150,18 @@ class Transcoder(GObject.GObject):
                                               'audioencoder')
             # When facc is missing, use avenc_aac and avmux_mp4
             # Ref: https://bugs.launchpad.net/ubuntu/+source/gst-plugins-bad1.0/+bug/1299376
+            # The preset is shared with other jobs and the GUI, so the
+            # replacement codec goes into a copy only used for this job
             if element is None and self.preset.acodec.name == 'faac':
-                self.preset.acodec.name = 'avenc_aac'
-                self.preset.acodec.passes[0] += ' compliance=experimental'
-                self.preset.acodec.container = 'mp4mux'
-                self.preset.acodec.passes = \
-                    remove_param_from_passes(self.preset.acodec.passes, 'profile')
+                preset = copy.copy(self.preset)
+                preset.acodec = copy.copy(self.preset.acodec)
+                passes = list(preset.acodec.passes)
+                passes[0] += ' compliance=experimental'
+                preset.acodec.name = 'avenc_aac'
+                preset.acodec.container = 'mp4mux'
+                preset.acodec.passes = \
+                    remove_param_from_passes(passes, 'profile')
+                self.options.preset = preset
                 element = Gst.ElementFactory.make('avenc_aac', 'audioencoder')
 
             cap = element.get_static_pad("sink").query_caps()
@@ -537,51 +1178,409 @@ class Transcoder(GObject.GObject):
                         new = get_list_value(struct, 'rate')
                     if new:
                         capable_rates = expand_capacity(capable_rates, new)
-                        self.preset.acodec.rate = capable_rates
                 if struct.has_field('channels'):
                     new = get_range_value(struct, 'channels')
                     if not new:
                         new = get_list_value(struct, 'channels')
                     if new:
                         capable_channels = expand_capacity(capable_channels, new)
-                        self.preset.acodec.channels = capable_channels
 
             # =================================================================
             # Prepare audio capabilities
             # =================================================================
+            # Clamp the source channels and sample rate to the nearest values
+            # allowed by both the preset and the encoder
             a_stream = self.info.get_audio_streams()[0]
-            self.acaps.set_value('channels', a_stream.get_channels())
+            channels = nearest_in_capacity(a_stream.get_channels(),
+                                           capable_channels,
+                                           min(self.preset.acodec.channels),
+                                           max(self.preset.acodec.channels))
+            rate = nearest_in_capacity(a_stream.get_sample_rate(),
+                                       capable_rates,
+                                       min(self.preset.acodec.rate),
+                                       max(self.preset.acodec.rate))
+            self.acaps.set_value('channels', channels)
             self.acaps.set_value('depth', a_stream.get_depth())
-            self.acaps.set_value('rate', a_stream.get_sample_rate())
+            self.acaps.set_value('rate', rate)
 
             # =================================================================
             # Add audio transcoding pipeline to command
             # =================================================================
-            aencoder = self.preset.acodec.name + " " + \
-                       self.preset.acodec.passes[ \
-                            len(self.preset.vcodec.passes) - \
-                            self.enc_pass - 1 \
-                       ] % {
-                            "threads": CPU_COUNT,
-                       }
+            apass = self._get_passes(self.preset.acodec)[
+                        len(self.preset.vcodec.passes) - self.enc_pass - 1]
+            aencoder = "%s name=audioencoder" % self.preset.acodec.name
+            if apass.caps:
+                aencoder += " ! " + apass.caps
+            self._encoder_settings.append(("audioencoder", apass,
+                                           apass.properties))
+            self._bitrate += get_bitrate(self.preset.acodec.name,
+                                         apass.properties) or 0
 
             amux = premux
             if container in ("qtmux", "webmmux", "avmux_dvd", "matroskamux", "mp4mux"):
                 if premux.startswith("mux"):
                     amux += "audio_%u"
+            if rtp:
+                amux = self._get_rtp_sink(self.preset.acodec.name, 1)
 
-            cmd += " dmux. ! queue ! audioconvert ! " \
+            # =================================================================
+            # Leave out conversion stages that would be no-ops
+            # =================================================================
+            aconvert = "audioconvert ! "
+            src_format = get_stream_format(a_stream)
+            enc_formats = get_caps_formats(cap)
+            if not needs_conversion(src_format, enc_formats) \
+               and self.acaps.get_structure(0).get_int("channels")[1] == \
+                   a_stream.get_channels():
+                aconvert = ""
+                self._elide("audioconvert",
+                            _("source format %(format)s accepted by "
+                              "encoder") % {"format": src_format})
+            elif not src_format:
+                self._keep("audioconvert")
+
+            aresample = "audioresample ! "
+            if self.acaps.get_structure(0).get_int("rate")[1] == \
+               a_stream.get_sample_rate():
+                aresample = ""
+                self._elide("audioresample",
+                            _("source rate %(rate)d Hz unchanged") % {
+                                "rate": a_stream.get_sample_rate(),
+                            })
+
+            cmd += " dmux. ! %s ! %s" \
                    "audiorate tolerance=100000000 ! " \
-                   "audioresample ! %s ! %s ! %s" % \
-                   (self.acaps.to_string(), aencoder, amux)
+                   "%s%s ! %s ! %s" % \
+                   (self._queue(leaky=True), aconvert, aresample, self.acaps.to_string(),
+                    aencoder, amux)
+
+        if self.elided:
+            _log.debug(_("Elided conversion stages: %(stages)s") % {
+                "stages": ", ".join(["%s (%s)" % x for x in self.elided]),
+            })
+        if self.kept:
+            _log.debug(_("Kept conversion stages: %(stages)s") % {
+                "stages": ", ".join(["%s (%s)" % x for x in self.kept]),
+            })
 
         # =====================================================================
         # Build the pipeline and get ready!
         # =====================================================================
         self._build_pipeline(cmd)
 
+        for name, pas, properties in self._encoder_settings:
+            pas.apply(self.pipe.get_by_name(name), properties)
+
+        sink = self.pipe.get_by_name("sink")
+        if self.output and sink:
+            # The sink truncates the file when opening it, so only reserve
+            # space once it is open
+            self.output.track(sink)
+            self.pipe.set_state(Gst.State.READY)
+            start, end = self.get_range()
+            self.output.preallocate(estimate_size(self._bitrate, end - start))
+
+        self._pending_seek = self._has_range()
+        if (self.options.start or self.options.end) and \
+           not self._pending_seek and self.enc_pass == 0:
+            _log.warning(_("Can't encode a range of live or streamed "
+                           "input, encoding everything"))
+
+        self.bytes_read = 0
+        streamsrc = self.pipe.get_by_name("streamsrc")
+        if streamsrc:
+            self.stream_reader.attach(streamsrc)
+            streamsrc.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER,
+                                                      self._on_read_probe)
+        else:
+            dmux = self.pipe.get_by_name("dmux")
+            if dmux.find_property("uri"):
+                dmux.connect("source-setup", self._on_source_setup)
+
+        encoder = self.pipe.get_by_name("videoencoder")
+        if encoder and self.live:
+            encoder.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER,
+                                                    self._on_latency_probe)
+
+        if self.thumbnail_branch:
+            start, end = self.get_range()
+            self.thumbnail_branch.attach(self.pipe, start, end)
+
+        decimator = self.pipe.get_by_name("decimate")
+        if decimator:
+            self.dropped_frames = 0
+            self._decimate_last = None
+            self._decimate_warned = False
+            decimator.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER,
+                                                      self._on_decimate_probe)
+
         self.emit("pass-setup")
 
+    def _analyze(self):
+        """
+            Run the detections the input and options need, such as black
+            bar and interlace detection, then set up and start the first
+            pass. They sample frames from the input, which takes a while,
+            so they run in a thread and the main loop carries on. Their
+            results are kept for all passes.
+        """
+        detections = {}
+        source = self._get_source()
+        duration = self.info.get_duration()
+
+        if is_video(self.info) and self.options.autocrop and \
+           not self.options.crop and not self.stream_reader:
+            detections["crop"] = lambda: detect_crop(source, duration)
+
+        v_streams = self.info.get_video_streams()
+        v_stream = v_streams and v_streams[0] or None
+        self.deinterlacing = self._needs_deinterlacing(v_stream)
+        if self.deinterlacing is None:
+            detections["interlacing"] = \
+                lambda: detect_interlacing(source, v_stream, duration)
+
+        self._analyzing = True
+        if not detections:
+            self._on_analyzed({})
+            return
+
+        def run():
+            results = {}
+            for name, detect in detections.items():
+                # The job would never start if the thread died, so go
+                # ahead without the result instead
+                try:
+                    results[name] = detect()
+                except Exception as e:
+                    _log.warning(_("Unable to analyze the input: "
+                                   "%(error)s") % {"error": str(e)})
+            GLib.idle_add(self._on_analyzed, results)
+
+        thread = threading.Thread(target=run, name="arista-analyze")
+        thread.daemon = True
+        thread.start()
+
+    def _on_analyzed(self, results):
+        """
+            Use the results of the detections and start the first pass.
+
+            @type results: dict
+            @param results: The result of each detection by name
+        """
+        if not self._analyzing:
+            # Stopped while analyzing
+            return False
+        self._analyzing = False
+
+        if "crop" in results:
+            self.detected_crop = results["crop"]
+            if any(self.detected_crop):
+                self.options.crop = self.detected_crop
+
+        if self.deinterlacing is None:
+            self.deinterlacing = results.get("interlacing") in \
+                                 (interlace.INTERLACED, interlace.MIXED)
+
+        if self.cancelled:
+            self._cleanup()
+            self.emit("complete")
+            return False
+
+        try:
+            self._setup_pass()
+        except PipelineException as e:
+            self._cleanup()
+            self.emit("error", str(e))
+            return False
+
+        self.start()
+        return False
+
+    def _needs_deinterlacing(self, v_stream):
+        """
+            Decide whether to deinterlace based on the deinterlace option
+            and, in auto mode, on what discovery says about the input.
+
+            @type v_stream: GstPbutils.DiscovererVideoInfo
+            @param v_stream: The discovered video stream
+            @rtype: bool
+            @return: True if the deinterlacer should be inserted, None if
+                     frames have to be sampled to tell
+        """
+        mode = self.options.deinterlace
+        if mode is True or mode == DEINTERLACE_FORCE:
+            return True
+        elif mode is False or mode == DEINTERLACE_OFF or not v_stream:
+            return False
+
+        interlacing = interlace.get_stream_interlacing(v_stream)
+        if interlacing:
+            return interlacing in (interlace.INTERLACED, interlace.MIXED)
+        elif self.stream_reader:
+            # Streamed input can't be sampled
+            return False
+
+        return None
+
+    def _has_range(self):
+        """
+            Check whether only part of the input should be encoded.
+
+            @rtype: bool
+            @return: True if a start or end position applies to this input
+        """
+        return bool((self.options.start or self.options.end) and
+                    not self.live and not self.stream_reader)
+
+    def get_range(self):
+        """
+            Get the part of the input to encode in nanoseconds.
+
+            @rtype: tuple
+            @return: A tuple of start, end where end is the input duration
+                     if no end was set
+        """
+        start = 0
+        end = self.info.get_duration()
+        if self._has_range():
+            if self.options.start:
+                start = int(self.options.start * Gst.SECOND)
+            if self.options.end:
+                end = int(self.options.end * Gst.SECOND)
+        return start, end
+
+    def _seek_to_range(self):
+        """
+            Seek the prerolled pipeline to the selected range. The stop
+            position makes the pipeline send EOS at the end of the range.
+        """
+        start, end = self.get_range()
+        stop_type = self.options.end and Gst.SeekType.SET or \
+                    Gst.SeekType.NONE
+        if not self.pipe.seek(1.0, Gst.Format.TIME,
+                              Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE,
+                              Gst.SeekType.SET, start, stop_type, end):
+            _log.warning(_("Unable to seek to %(start)d - %(end)d") % {
+                "start": start,
+                "end": end,
+            })
+
+    def _queue(self, leaky=False):
+        """
+            Return a queue description for the pipeline. Queues in front of
+            the encoders are leaky and time bounded in live mode, so a slow
+            encoder never adds up latency. Queues carrying encoded data
+            never drop anything, as that would corrupt the output.
+
+            @type leaky: bool
+            @param leaky: Whether the queue carries raw data that may be
+                          dropped in live mode
+            @rtype: str
+            @return: A queue element usable with Gst.parse_launch
+        """
+        return self.live and leaky and LIVE_QUEUE or "queue"
+
+    def _on_source_setup(self, dmux, source):
+        if self.read_ahead:
+            self.read_ahead.attach(source)
+
+        pad = source.get_static_pad("src")
+        if pad:
+            pad.add_probe(Gst.PadProbeType.BUFFER, self._on_read_probe)
+
+    def _on_read_probe(self, pad, info):
+        self.bytes_read += info.get_buffer().get_size()
+        return Gst.PadProbeReturn.OK
+
+    def _on_latency_probe(self, pad, info):
+        """
+            Count encoded frames and measure how long after capture they
+            leave the encoder. Live sources timestamp buffers with the
+            running time at capture, so the difference to the current
+            running time is the latency.
+        """
+        buf = info.get_buffer()
+        clock = self.pipe.get_clock()
+        if clock and buf.pts != Gst.CLOCK_TIME_NONE:
+            now = clock.get_time() - self.pipe.get_base_time()
+            self.latency = max(now - buf.pts, 0)
+            self.max_latency = max(self.max_latency, self.latency)
+        self.frames += 1
+        return Gst.PadProbeReturn.OK
+
+    def _on_decimate_probe(self, pad, info):
+        """
+            Drop a video frame if it is nearly the same as the last frame
+            that was kept. Frames are compared on their downscaled luma
+            plane, which is cheap and not thrown off by noise.
+        """
+        caps = pad.get_current_caps()
+        struct = caps and caps.get_structure(0)
+        layout = struct and LUMA_LAYOUTS.get(struct.get_string("format"))
+        if not layout:
+            if not self._decimate_warned:
+                _log.warning(_("Can't compare frames in %(format)s, not "
+                               "dropping duplicate frames") % {
+                    "format": struct and struct.get_string("format"),
+                })
+                self._decimate_warned = True
+            return Gst.PadProbeReturn.OK
+
+        width = struct.get_int("width")[1]
+        height = struct.get_int("height")[1]
+        offset, step = layout
+        # The default row alignment of raw video
+        stride = (width * step + 3) & ~3
+
+        buf = info.get_buffer()
+        success, mapinfo = buf.map(Gst.MapFlags.READ)
+        if not success:
+            return Gst.PadProbeReturn.OK
+        try:
+            if len(mapinfo.data) < stride * height:
+                return Gst.PadProbeReturn.OK
+            frame = get_luma_blocks(mapinfo.data, width, height, stride,
+                                    offset, step)
+        finally:
+            buf.unmap(mapinfo)
+
+        last = self._decimate_last
+        if last is not None and last.shape == frame.shape and \
+           buf.pts - self._decimate_last_pts < DECIMATE_MAX_GAP and \
+           numpy.abs(frame - last).mean() < self.options.decimate:
+            self.dropped_frames += 1
+            return Gst.PadProbeReturn.DROP
+
+        self._decimate_last = frame
+        self._decimate_last_pts = buf.pts
+        return Gst.PadProbeReturn.OK
+
+    def _elide(self, stage, reason):
+        """
+            Record a conversion stage that was left out of the pipeline
+            because it would not change the data flowing through it.
+
+            @type stage: str
+            @param stage: The name of the stage, e.g. videoconvert
+            @type reason: str
+            @param reason: A human-readable explanation
+        """
+        self.elided.append((stage, reason))
+
+    def _keep(self, stage):
+        """
+            Record a format conversion that stays in the pipeline because
+            the source is compressed and its decoder can output several
+            formats, so which one it picks is only known once the pipeline
+            negotiates. A kept conversion whose formats turn out to match
+            passes buffers through without copying them.
+
+            @type stage: str
+            @param stage: The name of the stage, e.g. videoconvert
+        """
+        self.kept.append((stage, _("decoded format of compressed source "
+                                   "only known at negotiation")))
+
     def _build_pipeline(self, cmd):
         """
             Build a Gstreamer pipeline from a given gst-launch style string and
@@ -615,23 +1614,80 @@ class Transcoder(GObject.GObject):
         t = message.type
         if t == Gst.MessageType.EOS:
             self.state = Gst.State.NULL
+            if self.options.decimate:
+                _log.debug(_("Dropped %(count)d duplicate frames") % {
+                    "count": self.dropped_frames,
+                })
+            _log.debug(_("Read %(size)s at %(rate)s/s") % {
+                "size": get_friendly_size(self.bytes_read),
+                "rate": get_friendly_size(self.get_read_rate()),
+            })
             self.emit("pass-complete")
-            if self.enc_pass < self.preset.pass_count - 1:
+            if self.enc_pass < self.preset.pass_count - 1 and \
+               not self.cancelled:
                 self.enc_pass += 1
                 self._setup_pass()
                 self.start()
             else:
+                if self.output and not self.cancelled:
+                    try:
+                        self.output.commit()
+                    except OSError as e:
+                        self._cleanup()
+                        self.emit("error", _("Unable to write %(filename)s: "
+                                             "%(error)s") % {
+                            "filename": self.options.output_uri,
+                            "error": str(e),
+                        })
+                        return
+                    self._check_faststart()
+                self._cleanup()
+                if self.thumbnail_branch and not self.cancelled:
+                    self.thumbnails = self.thumbnail_branch.save()
                 self.emit("complete")
+        elif t == Gst.MessageType.ASYNC_DONE and self._pending_seek:
+            # Prerolled, so an accurate seek can now be done before playing
+            self._pending_seek = False
+            self._seek_to_range()
+            self.state = Gst.State.PLAYING
         elif t == Gst.MessageType.ERROR:
             print(message.parse_error())
+            self._cleanup()
 
         self.emit("message", bus, message)
 
+    def _check_faststart(self):
+        """
+            Verify that fast start output really has its index at the start,
+            so it can be served without a rewrite.
+        """
+        if not self._faststart_muxer:
+            return
+
+        try:
+            self.faststart = is_faststart(self.options.output_uri)
+        except IOError as e:
+            _log.warning(_("Unable to check %(filename)s: %(error)s") % {
+                "filename": self.options.output_uri,
+                "error": str(e),
+            })
+            return
+
+        if not self.faststart:
+            _log.warning(_("%(filename)s has its index at the end and needs "
+                           "to be rewritten for fast start") % {
+                "filename": self.options.output_uri,
+            })
+
     def start(self, reset_timer=True):
         """
-            Start the pipeline!
+            Start the pipeline! When encoding a range the pipeline is only
+            prerolled here and starts playing after seeking.
         """
-        self.state = Gst.State.PLAYING
+        if self._pending_seek:
+            self.state = Gst.State.PAUSED
+        else:
+            self.state = Gst.State.PLAYING
         if reset_timer:
             self.start_time = time.time()
 
@@ -643,9 +1699,34 @@ class Transcoder(GObject.GObject):
 
     def stop(self):
         """
-            Stop the pipeline!
+            Stop the pipeline! Output that was not completed is deleted.
         """
+        self._analyzing = False
         self.state = Gst.State.NULL
+        self._cleanup()
+
+    def _cleanup(self):
+        """
+            Release the resources of this job. Output that was not completed
+            is deleted along with the scratch directory.
+        """
+        if self.read_ahead:
+            self.read_ahead.close()
+        if self.output:
+            self.output.discard()
+        if self.scratch_dir:
+            shutil.rmtree(self.scratch_dir, ignore_errors=True)
+            self.scratch_dir = None
+
+    def cancel(self):
+        """
+            Stop encoding early. The pipeline is drained and emits complete
+            as usual, but the partial output is deleted.
+        """
+        self.cancelled = True
+        if self.pipe:
+            self.pipe.send_event(Gst.Event.new_eos())
+            self.start()
 
     def get_state(self):
         """
@@ -686,7 +1767,8 @@ class Transcoder(GObject.GObject):
             @rtype: tuple
             @return: A tuple of percent, time_rem
         """
-        duration = self.info.get_duration()
+        start, end = self.get_range()
+        duration = end - start
 
         if not duration or duration < 0:
             return 0.0, _("Unknown")
@@ -698,11 +1780,12 @@ class Transcoder(GObject.GObject):
         except AttributeError:
             raise TranscoderStatusException(_("No pipeline to query!"))
 
-        percent = pos / duration
+        percent = (pos - start) / duration
         if percent <= 0.0:
             return 0.0, _("Unknown")
 
-        if self._percent_cached == percent and time.time() - self._percent_cached_time > 5:
+        if not self.live and self._percent_cached == percent and \
+           time.time() - self._percent_cached_time > 5:
             self.pipe.post_message(Gst.Message.new_eos(self.pipe))
 
         if self._percent_cached != percent:
@@ -727,17 +1810,56 @@ class Transcoder(GObject.GObject):
 
     status = property(get_status)
 
+    def get_read_rate(self):
+        """
+            Get how fast the input is read during the current pass.
+
+            @rtype: float
+            @return: The average number of bytes read per second
+        """
+        elapsed = time.time() - self.start_time
+        return elapsed > 0 and self.bytes_read / elapsed or 0.0
+
+    def get_live_status(self):
+        """
+            Get information about the status of a live encode, which has no
+            known duration to compute a percentage or time remaining from.
+
+            @rtype: tuple
+            @return: A tuple of nicely formatted elapsed time, encoded frames
+                     per second and latency in milliseconds
+        """
+        elapsed = time.time() - self.start_time
+        fps = elapsed > 0 and self.frames / elapsed or 0.0
+
+        time_elapsed = _("%(min)d:%(sec)02d") % {
+            "min": elapsed / 60,
+            "sec": elapsed % 60,
+        }
+
+        return time_elapsed, fps, self.latency / Gst.MSECOND
+
+    live_status = property(get_live_status)
+
     def on_got_info(self, disc, info, error):
         self.info = info
-        r = GstPbutils.DiscovererInfo.get_result(info)
-        is_media = r == GstPbutils.DiscovererResult.OK
-        self.emit("discovered", info, is_media)
 
-        if is_video(info) or is_audio(info):
+        if self.stream_reader:
             try:
-                self._setup_pass()
-            except PipelineException as e:
+                self.stream_reader.rewind()
+            except ValueError as e:
+                # Discovery only saw the start of the input
                 self.emit("error", str(e))
                 return
 
-            self.start()
+        r = GstPbutils.DiscovererInfo.get_result(info)
+        is_media = r == GstPbutils.DiscovererResult.OK
+        self.emit("discovered", info, is_media)
+
+        if self.stream_reader and self.preset.pass_count > 1:
+            self.emit("error", _("Multi-pass presets can't be used "
+                                 "with streamed input!"))
+            return
+
+        if is_video(info) or is_audio(info):
+            self._analyze()
@@ -31,18 +31,39 @@ import re
 import sys
 import gettext
 import fractions
+import threading
 
 _ = gettext.gettext
 
-RE_ENDS_NUM = re.compile(r'^.*(?P<number>[0-9]+)$')
+RE_ENDS_NUM = re.compile(r'^.*?(?P<number>[0-9]+)$')
+
+# Output filename templates, see OutputAllocator
+OUTPUT_TEMPLATE = "{stem}.{ext}"
+OUTPUT_TEMPLATE_DEVICE = "{stem}-{device}.{ext}"
+
+# Input locations whose output is named after the last path component and
+# written to the current directory
+URI_PREFIXES = ("dvd://", "v4l://", "v4l2://", "testbin://", "fd://", "http://",
+                "https://")
+
+# Default to 2 CPUs as most seem to be dual-core these days
+CPU_COUNT = 2
+try:
+    import multiprocessing
+    try:
+        CPU_COUNT = multiprocessing.cpu_count()
+    except NotImplementedError:
+        pass
+except ImportError:
+    pass
 
 
 # Subclass fractions.Fraction, so that this call work: Fraction('3 / 1')
 class Fraction(fractions.Fraction):
-    def __new__(cls, numerator=0, denominator=None, _normalize=True):
+    def __new__(cls, numerator=0, denominator=None):
         if isinstance(numerator, str):
             numerator = numerator.replace(' ', '')
-        return super(Fraction, cls).__new__(cls, numerator=0, denominator=None, _normalize=True)
+        return super(Fraction, cls).__new__(cls, numerator, denominator)
 
     @property
     def num(self):
@@ -162,10 +183,270 @@ def get_friendly_time(seconds):
       "seconds": seconds,
    }
 
+def get_friendly_size(size):
+    """
+        Get a human-friendly size description from a number of bytes.
+
+            >>> get_friendly_size(512)
+            '512 B'
+            >>> get_friendly_size(3 * 1024 * 1024 + 200 * 1024)
+            '3.2 MiB'
+    """
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024 or unit == "GiB":
+            break
+        size /= 1024.0
+
+    if unit == "B":
+        return "%d %s" % (size, unit)
+
+    return "%.1f %s" % (size, unit)
+
+def parse_friendly_time(value):
+    """
+        Parse a time given as seconds or as [hours:]minutes:seconds.
+
+            >>> parse_friendly_time("90")
+            90.0
+            >>> parse_friendly_time("1:30.5")
+            90.5
+            >>> parse_friendly_time("01:00:00")
+            3600.0
+
+        @type value: str
+        @param value: The time to parse
+        @rtype: float
+        @return: The time in seconds
+        @raise ValueError: The time can't be parsed
+    """
+    seconds = 0.0
+    for part in value.split(":"):
+        seconds = seconds * 60 + float(part)
+
+    return seconds
+
+class OutputAllocator(object):
+    """
+        Pick unique output filenames for a batch of jobs. Each output
+        directory is listed once and names handed out are kept in a set, so
+        allocating stays cheap however many similarly named outputs a batch
+        has. When a job starts its name is claimed by creating the file
+        exclusively, which catches files that appeared in the meantime, e.g.
+        from another process.
+
+        Names are made from a template with the fields stem (the input name
+        without extension), device (the device short name), preset (the
+        preset name) and ext (the preset extension). Names that are taken
+        get a number before the extension, e.g. movie-ipod1.m4v, or have
+        the number they end with counted up, e.g. part3.m4v for part2.m4v.
+    """
+    def __init__(self, template=None, directory=None):
+        """
+            @type template: str
+            @param template: The output filename template, e.g.
+                             "{stem}-{device}-{preset}.{ext}"; by default
+                             OUTPUT_TEMPLATE_DEVICE if a device name is
+                             given, otherwise OUTPUT_TEMPLATE
+            @type directory: str
+            @param directory: The output directory, by default the directory
+                              of each input
+            @raise ValueError: The template is invalid
+        """
+        if template:
+            try:
+                template.format(stem="", device="", preset="", ext="")
+            except (KeyError, IndexError) as e:
+                raise ValueError("Unknown output template field %s" % e)
+
+        self.template = template
+        self.directory = directory
+
+        self._listings = {}
+        self._reserved = set()
+        self._excluded = set()
+        self._claimed = set()
+        self._counters = {}
+        self._origins = {}
+        self._lock = threading.Lock()
+
+    def _listing(self, directory):
+        if directory not in self._listings:
+            try:
+                self._listings[directory] = set([entry.name for entry in
+                                                 os.scandir(directory)])
+            except OSError:
+                self._listings[directory] = set()
+
+        return self._listings[directory]
+
+    def _is_free(self, path):
+        full = os.path.abspath(path)
+        return full not in self._reserved and full not in self._excluded and \
+               os.path.basename(full) not in \
+               self._listing(os.path.dirname(full))
+
+    def _next_free(self, path):
+        base, ext = os.path.splitext(path)
+        number = 1
+        result = RE_ENDS_NUM.search(base)
+        if result:
+            value = result.group("number")
+            base = base[:-len(value)]
+            number = int(value) + 1
+
+        number = self._counters.get(path, number)
+        while not self._is_free("%s%d%s" % (base, number, ext)):
+            number += 1
+        self._counters[path] = number + 1
+
+        return "%s%d%s" % (base, number, ext)
+
+    def exclude(self, path):
+        """
+            Keep a path from being handed out, e.g. an output given by the
+            user. Excluded paths are never claimed, so existing files are
+            overwritten and streams or network outputs are left alone.
+
+            @type path: str
+            @param path: The path to exclude
+        """
+        with self._lock:
+            self._excluded.add(os.path.abspath(path))
+
+    def is_output(self, path):
+        """
+            Check whether a path has been reserved or handed out, e.g. to
+            keep outputs written into a directory that is being searched for
+            inputs from being picked up again.
+
+            @type path: str
+            @param path: The path to check
+            @rtype: bool
+            @return: True if the path is an output of this allocator
+        """
+        full = os.path.abspath(path)
+        with self._lock:
+            return full in self._reserved or full in self._excluded or \
+                   full in self._origins
+
+    def allocate(self, filename, preset, device_name="", directory=None):
+        '''
+        Get a unique output path for an input and reserve it.
+
+        >>> class Preset:
+        ...     name = "H.264"
+        ...     extension = "mp4"
+        >>> allocator = OutputAllocator(directory="/nonexistent")
+        >>> allocator.allocate("/videos/clip.avi", Preset())
+        '/nonexistent/clip.mp4'
+        >>> allocator.allocate("/videos/clip.mkv", Preset())
+        '/nonexistent/clip1.mp4'
+        >>> allocator.allocate("/videos/clip.mov", Preset())
+        '/nonexistent/clip2.mp4'
+        >>> allocator.allocate("clip.mkv", Preset(), "ipod")
+        '/nonexistent/clip-ipod.mp4'
+
+        @type filename: str
+        @param filename: The input file name or URI
+        @type preset: arista.presets.Preset
+        @param preset: The preset being encoded
+        @type device_name: str
+        @param device_name: The device short name
+        @type directory: str
+        @param directory: The output directory, overriding the one of the
+                          allocator
+        @rtype: str
+        @return: The output path
+        '''
+        if filename == "-":
+            filename = "stdin"
+
+        name = os.path.splitext(filename)[0]
+        if name.startswith(URI_PREFIXES):
+            # Is this a special URI? Let's just use the basename then!
+            name = os.path.basename(name)
+
+        template = self.template or \
+                   (device_name and OUTPUT_TEMPLATE_DEVICE or OUTPUT_TEMPLATE)
+        output = template.format(stem=os.path.basename(name) or "output",
+                                 device=device_name,
+                                 preset=preset.name.replace(os.sep, "-"),
+                                 ext=preset.extension)
+
+        if directory is None:
+            directory = self.directory
+        if directory is None:
+            directory = os.path.dirname(name)
+        path = os.path.join(directory, output)
+
+        with self._lock:
+            origin = path
+            if not self._is_free(path):
+                path = self._next_free(path)
+            self._reserved.add(os.path.abspath(path))
+            self._origins[os.path.abspath(path)] = origin
+
+        return path
+
+    def claim(self, path):
+        """
+            Create an output file handed out by allocate() exclusively, right
+            before a job writes it. If it has been created by someone else
+            since, the next free name is claimed instead. Paths that were not
+            allocated here are returned unchanged.
+
+            @type path: str
+            @param path: The allocated path
+            @rtype: str
+            @return: The claimed path
+        """
+        with self._lock:
+            full = os.path.abspath(path)
+            if full not in self._reserved or full not in self._origins:
+                return path
+
+            origin = self._origins.get(os.path.abspath(path), path)
+            while True:
+                try:
+                    os.close(os.open(path, os.O_WRONLY | os.O_CREAT |
+                                           os.O_EXCL, 0o644))
+                except FileExistsError:
+                    self._listing(os.path.dirname(os.path.abspath(path))) \
+                        .add(os.path.basename(path))
+                    path = self._next_free(origin)
+                    self._reserved.add(os.path.abspath(path))
+                    self._origins[os.path.abspath(path)] = origin
+                    continue
+
+                self._claimed.add(os.path.abspath(path))
+                return path
+
+    def release(self, path):
+        """
+            Give up a path, e.g. after its job failed. A claimed file that is
+            still empty is deleted.
+
+            @type path: str
+            @param path: The allocated or claimed path
+        """
+        full = os.path.abspath(path)
+        with self._lock:
+            if full in self._claimed:
+                self._claimed.discard(full)
+                try:
+                    if not os.path.getsize(full):
+                        os.unlink(full)
+                except OSError:
+                    pass
+            self._reserved.discard(full)
+
+
 def generate_output_path(filename, preset, to_be_created=[],
                          device_name=""):
     """
         Generate a new output filename from an input filename and preset.
+        For batches use an OutputAllocator, which does not list the output
+        directory again for every file.
 
         @type filename: str
         @param filename: The input file name
@@ -181,31 +462,11 @@ def generate_output_path(filename, preset, to_be_created=[],
         @rtype: str
         @return: A new unique generated output path
     """
-    name, ext = os.path.splitext(filename)
-
-    # Is this a special URI? Let's just use the basename then!
-    if name.startswith("dvd://") or name.startswith("v4l://") or name.startswith("v4l2://"):
-        name = os.path.basename(name)
+    allocator = OutputAllocator()
+    for path in to_be_created:
+        allocator.exclude(path)
 
-    if device_name:
-        name += "-" + device_name
-    default_out = name + "." + preset.extension
-
-    while os.path.exists(default_out) or default_out in to_be_created:
-        parts = default_out.split(".")
-        name, ext = ".".join(parts[:-1]), parts[-1]
-
-        result = RE_ENDS_NUM.search(name)
-        if result:
-            value = result.group("number")
-            name = name[:-len(value)]
-            number = int(value) + 1
-        else:
-            number = 1
-
-        default_out = "%s%d.%s" % (name, number, ext)
-
-    return default_out
+    return allocator.allocate(filename, preset, device_name)
 
 
 def merge_range_and_tuple(r, t):
@@ -267,3 +528,34 @@ def expand_capacity(current, new):
     union = tuple(set(current) | set(new))
     return tuple(sorted(union))
 
+
+
+def nearest_in_capacity(value, capacity, lower, upper):
+    '''
+    Pick the value closest to value which the capacity (as returned by
+    expand_capacity) allows and which lies between lower and upper. If no
+    allowed value lies between the bounds, the bounds are ignored.
+
+    >>> nearest_in_capacity(96000, range(1, 200000), 8000, 48000)
+    48000
+    >>> nearest_in_capacity(6, range(1, 3), 1, 6)
+    2
+    >>> nearest_in_capacity(22050, (8000, 32000, 44100, 48000), 8000, 48000)
+    32000
+    >>> nearest_in_capacity(96000, (8000, 32000, 44100, 48000), 8000, 22050)
+    8000
+    >>> nearest_in_capacity(60, range(0, 0), 1, 30)
+    30
+    '''
+    if isinstance(capacity, range) and not len(capacity):
+        capacity = range(lower, upper + 1)
+
+    if isinstance(capacity, range):
+        low = max(lower, capacity.start)
+        high = min(upper, capacity.stop - 1)
+        if low > high:
+            low, high = capacity.start, capacity.stop - 1
+        return min(max(value, low), high)
+
+    allowed = [x for x in capacity if lower <= x <= upper] or list(capacity)
+    return min(allowed, key=lambda x: (abs(x - value), -x))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+"""
+    Arista Test Helpers
+    ===================
+    Shared setup for the tests: importing GStreamer if it is available and
+    generating short input files.
+
+    License
+    -------
+    Copyright 2008 - 2011 Daniel G. Taylor <dan@programmer-art.org>
+
+    This file is part of Arista.
+
+    Arista is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as
+    published by the Free Software Foundation, either version 2.1 of
+    the License, or (at your option) any later version.
+
+    Arista is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with Arista.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+try:
+    import gi
+    gi.require_version('Gst', '1.0')
+    from gi.repository import Gst
+except (ImportError, ValueError):
+    Gst = None
+
+# A hang shows up as a timeout instead of a stuck test run
+TIMEOUT = 120
+
+# Two seconds of a moving test pattern, compressed and raw
+THEORA_SOURCE = "videotestsrc num-buffers=60 pattern=ball ! " \
+                "video/x-raw,width=320,height=240,framerate=30/1 ! " \
+                "theoraenc ! oggmux ! filesink location=%s"
+RAW_SOURCE = "videotestsrc num-buffers=60 pattern=ball ! " \
+             "video/x-raw,format=I420,width=320,height=240," \
+             "framerate=30/1 ! y4menc ! filesink location=%s"
+
+requires_gst = unittest.skipIf(Gst is None, "GStreamer is not available")
+
+
+def require_elements(test, *names):
+    """
+        Skip a test unless the given elements are installed.
+
+        @type test: unittest.TestCase
+        @param test: The running test
+    """
+    Gst.init(None)
+    for name in names:
+        if not Gst.ElementFactory.find(name):
+            test.skipTest("%s is not available" % name)
+
+
+def get_preset(test, device="computer"):
+    """
+        Get the default preset of a device, skipping the test if it can't
+        be used here.
+
+        @type test: unittest.TestCase
+        @param test: The running test
+        @rtype: Preset
+        @return: The default preset of the device
+    """
+    import arista.presets
+    preset = arista.presets.get()[device].default_preset
+    if preset.missing:
+        test.skipTest("Missing elements: %s" % ", ".join(preset.missing))
+
+    return preset
+
+
+def make_input(test, source, filename):
+    """
+        Write a short input file with a gst-launch style pipeline.
+
+        @type test: unittest.TestCase
+        @param test: The running test
+        @type source: str
+        @param source: The pipeline, with %s for the filename
+        @type filename: str
+        @param filename: Where to write the file
+    """
+    pipe = Gst.parse_launch(source % filename)
+    pipe.set_state(Gst.State.PLAYING)
+    message = pipe.get_bus().timed_pop_filtered(
+        TIMEOUT * Gst.SECOND, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+    pipe.set_state(Gst.State.NULL)
+    test.assertEqual(message.type, Gst.MessageType.EOS)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+"""
+    Arista Startup Tests
+    ====================
+    Check that commands which don't touch media start without importing
+    GStreamer.
+
+    License
+    -------
+    Copyright 2008 - 2011 Daniel G. Taylor <dan@programmer-art.org>
+
+    This file is part of Arista.
+
+    Arista is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as
+    published by the Free Software Foundation, either version 2.1 of
+    the License, or (at your option) any later version.
+
+    Arista is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with Arista.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+from common import ROOT
+
+# Run the command line client and print the GStreamer modules it imported
+CHILD = """
+import runpy, sys
+sys.argv = [%(script)r] + %(args)r
+try:
+    runpy.run_path(%(script)r, run_name="__main__")
+except SystemExit:
+    pass
+sys.stderr.write(repr(sorted(x for x in sys.modules
+                             if x == "gi" or x.startswith("gi.")
+                             or x == "arista.discoverer")))
+"""
+
+
+class TestStartup(unittest.TestCase):
+    def get_imported(self, *args):
+        script = os.path.join(ROOT, "arista-transcode")
+        process = subprocess.run([sys.executable, "-c", CHILD % {
+                                      "script": script,
+                                      "args": list(args),
+                                  }],
+                                 cwd=ROOT, stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.PIPE,
+                                 universal_newlines=True)
+        return process.stderr.strip().splitlines()[-1]
+
+    def test_help(self):
+        self.assertEqual(self.get_imported("--help"), "[]")
+
+
+if __name__ == "__main__":
+    unittest.main()
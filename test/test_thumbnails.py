@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+"""
+    Arista Thumbnail Tests
+    ======================
+    Run a short generated file through arista-transcode with thumbnails
+    enabled and check that the encode finishes and the contact sheet is
+    written. Skipped when GStreamer or the needed elements are missing.
+
+    License
+    -------
+    Copyright 2008 - 2011 Daniel G. Taylor <dan@programmer-art.org>
+
+    This file is part of Arista.
+
+    Arista is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as
+    published by the Free Software Foundation, either version 2.1 of
+    the License, or (at your option) any later version.
+
+    Arista is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with Arista.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from common import ROOT, TIMEOUT, THEORA_SOURCE, requires_gst, \
+                   require_elements, get_preset, make_input
+
+
+@requires_gst
+class TestThumbnails(unittest.TestCase):
+    def setUp(self):
+        require_elements(self, "videotestsrc", "theoraenc", "oggmux")
+        self.preset = get_preset(self)
+
+        self.directory = tempfile.mkdtemp(prefix="arista-test-")
+        self.input = os.path.join(self.directory, "input.ogv")
+        make_input(self, THEORA_SOURCE, self.input)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_encode_with_thumbnails(self):
+        output = os.path.join(self.directory, "output")
+        sheet = os.path.join(self.directory, "sheet.jpg")
+
+        ret = subprocess.call([sys.executable,
+                               os.path.join(ROOT, "arista-transcode"),
+                               "-q", "-d", "computer", "--thumbnails", "4",
+                               "--contact-sheet", sheet, "-o", output,
+                               self.input],
+                              cwd=ROOT, timeout=TIMEOUT)
+
+        self.assertEqual(ret, 0)
+        self.assertTrue(os.path.getsize(output))
+        self.assertTrue(os.path.getsize(sheet))
+
+    def test_default_sheet_named_after_output(self):
+        # The allocated name is taken, so the output and sheet get a number
+        taken = os.path.join(self.directory,
+                             "input-computer." + self.preset.extension)
+        open(taken, "w").close()
+
+        ret = subprocess.call([sys.executable,
+                               os.path.join(ROOT, "arista-transcode"),
+                               "-q", "-d", "computer", "--thumbnails", "4",
+                               self.input],
+                              cwd=ROOT, timeout=TIMEOUT)
+
+        self.assertEqual(ret, 0)
+        output = os.path.join(self.directory,
+                              "input-computer1." + self.preset.extension)
+        self.assertTrue(os.path.getsize(output))
+        self.assertTrue(os.path.getsize(os.path.join(self.directory,
+                                        "input-computer1-sheet.jpg")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+"""
+    Arista Transcoder Tests
+    =======================
+    Set up the first pass for short generated files and check the pipeline
+    that is built for them. Skipped when GStreamer or the needed elements
+    are missing.
+
+    License
+    -------
+    Copyright 2008 - 2011 Daniel G. Taylor <dan@programmer-art.org>
+
+    This file is part of Arista.
+
+    Arista is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as
+    published by the Free Software Foundation, either version 2.1 of
+    the License, or (at your option) any later version.
+
+    Arista is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with Arista.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from common import Gst, TIMEOUT, THEORA_SOURCE, RAW_SOURCE, \
+                   requires_gst, require_elements, get_preset, make_input
+
+
+class PassTestCase(unittest.TestCase):
+    def setUp(self):
+        require_elements(self, "videotestsrc", "theoraenc", "oggmux",
+                         "y4menc")
+        self.preset = get_preset(self)
+        self.directory = tempfile.mkdtemp(prefix="arista-test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def setup_pass(self, source, name, **kwargs):
+        """
+            Discover a generated input and set up the first pass for it,
+            passing any keyword arguments on to TranscoderOptions.
+
+            @rtype: Transcoder
+            @return: The transcoder, stopped after setting up the pass
+        """
+        from gi.repository import GLib
+        from arista.discoverer import get_caps_formats
+        from arista.transcoder import Transcoder, TranscoderOptions
+
+        filename = os.path.join(self.directory, name)
+        make_input(self, source, filename)
+
+        enc_formats = get_caps_formats(
+            Gst.ElementFactory.make(self.preset.vcodec.name, None)
+               .get_static_pad("sink").query_caps())
+        if enc_formats is not None and "I420" not in enc_formats:
+            self.skipTest("%s does not take I420" % self.preset.vcodec.name)
+
+        loop = GLib.MainLoop()
+        errors = []
+        options = TranscoderOptions(Gst.filename_to_uri(filename),
+                                    self.preset,
+                                    os.path.join(self.directory, "output"),
+                                    **kwargs)
+        transcoder = Transcoder(options)
+        transcoder.connect("pass-setup", lambda t: loop.quit())
+        transcoder.connect("error", lambda t, e: (errors.append(e),
+                                                  loop.quit()))
+        GLib.timeout_add_seconds(TIMEOUT, loop.quit)
+        loop.run()
+        transcoder.stop()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(transcoder.enc_pass, 0)
+        return transcoder
+
+
+@requires_gst
+class TestElision(PassTestCase):
+    def test_raw_source_elided(self):
+        transcoder = self.setup_pass(RAW_SOURCE, "input.y4m")
+        self.assertIn("videoconvert", [x[0] for x in transcoder.elided])
+        self.assertNotIn("videoconvert", [x[0] for x in transcoder.kept])
+
+    def test_compressed_source_kept(self):
+        # theoradec can output several formats, so the one it picks is
+        # only known once the pipeline negotiates
+        from arista.discoverer import get_factory_formats
+        if len(get_factory_formats("theoradec") or ()) < 2:
+            self.skipTest("theoradec outputs a single format")
+
+        transcoder = self.setup_pass(THEORA_SOURCE, "input.ogv")
+        self.assertIn("videoconvert", [x[0] for x in transcoder.kept])
+        self.assertNotIn("videoconvert", [x[0] for x in transcoder.elided])
+
+
+@requires_gst
+class TestAnalysis(PassTestCase):
+    def test_autocrop(self):
+        # Detection runs in a thread, the pass is set up once it is done
+        transcoder = self.setup_pass(RAW_SOURCE, "input.y4m", autocrop=True)
+        self.assertEqual(len(transcoder.detected_crop), 4)
+
+    def test_progressive_not_deinterlaced(self):
+        transcoder = self.setup_pass(RAW_SOURCE, "input.y4m")
+        self.assertIs(transcoder.deinterlacing, False)
+
+
+@requires_gst
+class TestLive(PassTestCase):
+    def get_pipeline(self, **kwargs):
+        """
+            Set up the first pass and get the gst-launch string it built.
+        """
+        with self.assertLogs("arista.transcoder", level="DEBUG") as logs:
+            self.setup_pass(RAW_SOURCE, "input.y4m", **kwargs)
+
+        pipelines = [x.getMessage() for x in logs.records
+                     if " dmux. ! " in x.getMessage()]
+        self.assertEqual(len(pipelines), 1)
+        return pipelines[0]
+
+    def test_live_queues_on_raw_branches(self):
+        from arista.transcoder import LIVE_QUEUE
+
+        cmd = self.get_pipeline(live=True)
+        # Only queues right after the decoder carry raw data that may be
+        # dropped; the queues in front of the muxer must never leak
+        branches = cmd.split(" dmux. ! ")
+        self.assertGreater(len(branches), 1)
+        self.assertNotIn(LIVE_QUEUE, branches[0])
+        for branch in branches[1:]:
+            self.assertTrue(branch.startswith(LIVE_QUEUE))
+            self.assertNotIn(LIVE_QUEUE, branch[len(LIVE_QUEUE):])
+
+    def test_no_live_queues_otherwise(self):
+        from arista.transcoder import LIVE_QUEUE
+
+        self.assertNotIn(LIVE_QUEUE, self.get_pipeline(live=False))
+
+
+if __name__ == "__main__":
+    unittest.main()
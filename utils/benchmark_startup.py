@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+"""
+	Arista Startup Benchmark
+	========================
+	Measure how long the steps of starting Arista take, each in a fresh
+	interpreter so nothing is cached in memory: importing the package,
+	loading the preset index, importing the GStreamer based modules and
+	initializing GStreamer, plus the total time of arista-transcode --info.
+
+	Usage: ./utils/benchmark_startup.py [runs]
+
+	License
+	-------
+	Copyright 2008 - 2011 Daniel G. Taylor <dan@programmer-art.org>
+
+	This file is part of Arista.
+
+	Arista is free software: you can redistribute it and/or modify
+	it under the terms of the GNU Lesser General Public License as
+	published by the Free Software Foundation, either version 2.1 of
+	the License, or (at your option) any later version.
+
+	Arista is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU Lesser General Public License for more details.
+
+	You should have received a copy of the GNU Lesser General Public
+	License along with Arista.  If not, see
+	<http://www.gnu.org/licenses/>.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter, printing the time each step took
+CHILD = """
+import json, sys, time
+sys.path.insert(0, %(root)r)
+times = []
+last = time.perf_counter()
+def step(name):
+	global last
+	now = time.perf_counter()
+	times.append((name, now - last))
+	last = now
+import arista
+step("import arista")
+arista.presets.get()
+step("load preset index")
+import arista.transcoder
+step("import transcoder")
+arista.init()
+step("initialize GStreamer")
+print(json.dumps(times))
+"""
+
+def median(values):
+	values = sorted(values)
+	return values[len(values) // 2]
+
+def run(runs):
+	results = {}
+	order = []
+
+	for i in range(runs):
+		output = subprocess.check_output([sys.executable, "-c",
+		                                  CHILD % {"root": ROOT}])
+		for name, seconds in json.loads(output):
+			if name not in results:
+				order.append(name)
+			results.setdefault(name, []).append(seconds)
+
+		start = time.perf_counter()
+		subprocess.check_call([sys.executable,
+		                       os.path.join(ROOT, "arista-transcode"),
+		                       "--info"], stdout=subprocess.DEVNULL, cwd=ROOT)
+		name = "arista-transcode --info"
+		if name not in results:
+			order.append(name)
+		results.setdefault(name, []).append(time.perf_counter() - start)
+
+	return [(name, results[name]) for name in order]
+
+if __name__ == "__main__":
+	runs = len(sys.argv) > 1 and int(sys.argv[1]) or 5
+
+	print("%-26s %10s %10s" % ("Step (%d runs)" % runs, "min ms", "median ms"))
+	for name, times in run(runs):
+		print("%-26s %10.1f %10.1f" % (name, min(times) * 1000,
+		                               median(times) * 1000))
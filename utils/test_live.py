@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+"""
+	Arista Live Mode Test
+	=====================
+	Encode from a live test source standing in for a camera, using the
+	testsrcbin element from gst-plugins-bad: a bouncing ball from
+	videotestsrc is-live=true and a tone from audiotestsrc is-live=true.
+	The sources stop after the given number of seconds, so the encode
+	finishes on its own and the live status and output can be checked.
+	The live pipeline itself is checked automatically by the tests in
+	test/test_transcoder.py; this script is for trying real encodes.
+
+	Usage: ./utils/test_live.py [seconds] [device] [preset]
+
+	License
+	-------
+	Copyright 2008 - 2011 Daniel G. Taylor <dan@programmer-art.org>
+
+	This file is part of Arista.
+
+	Arista is free software: you can redistribute it and/or modify
+	it under the terms of the GNU Lesser General Public License as
+	published by the Free Software Foundation, either version 2.1 of
+	the License, or (at your option) any later version.
+
+	Arista is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU Lesser General Public License for more details.
+
+	You should have received a copy of the GNU Lesser General Public
+	License along with Arista.  If not, see
+	<http://www.gnu.org/licenses/>.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 30 frames and 1024 samples at 44.1 kHz per buffer by default
+SOURCE = "testbin://video,is-live=true,pattern=ball,num-buffers=%d+" \
+         "audio,is-live=true,wave=ticks,num-buffers=%d"
+
+if __name__ == "__main__":
+	seconds = len(sys.argv) > 1 and int(sys.argv[1]) or 10
+	device = len(sys.argv) > 2 and sys.argv[2] or "computer"
+	preset = len(sys.argv) > 3 and sys.argv[3] or "Live Input H.264"
+
+	directory = tempfile.mkdtemp(prefix="arista-live-")
+	output = os.path.join(directory, "live")
+
+	ret = subprocess.call([sys.executable,
+	                       os.path.join(ROOT, "arista-transcode"),
+	                       "--live", "-d", device, "-p", preset,
+	                       "-o", output,
+	                       SOURCE % (seconds * 30, seconds * 44100 // 1024)],
+	                      cwd=ROOT)
+
+	if ret or not os.path.exists(output) or not os.path.getsize(output):
+		print("Live test failed, see %s" % directory)
+		raise SystemExit(1)
+
+	print("Live test succeeded, wrote %d bytes to %s" % (
+		os.path.getsize(output), output))